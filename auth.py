@@ -1,97 +1,322 @@
 import jwt
 import bcrypt
-from datetime import datetime, timedelta, timezone
+import orjson
+import asyncio
+import base64
+import binascii
+import os
+import hashlib
+import hmac
+import re
+import secrets
+import threading
+import time
+from dataclasses import asdict, dataclass
 from typing import Optional
-from fastapi import HTTPException, Depends, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, Depends, Request, status
+from fastapi.security import HTTPBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 
 from config import settings
 from database import get_db
-from models import User, Subscription
+from models import User, Subscription, SubscriptionTier
 from utils.exceptions import CustomHTTPException
 
-security = HTTPBearer()
+class BearerToken(HTTPBearer):
+    """HTTPBearer that hands back the raw token string.
+
+    Keeps the OpenAPI security scheme used by the docs while skipping the
+    HTTPAuthorizationCredentials model built on every request.
+    """
+
+    async def __call__(self, request: Request) -> str:
+        authorization = request.headers.get("Authorization")
+        if not authorization or authorization[:7].lower() != "bearer ":
+            raise CustomHTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authenticated",
+                error_code="NOT_AUTHENTICATED"
+            )
+        return authorization[7:]
+
+security = BearerToken()
+
+# Decoded JWT payloads keyed by token digest, so repeated requests with the
+# same bearer token skip signature verification and claim parsing.
+_DECODE_CACHE_TTL = 30
+_decode_cache: TTLCache = TTLCache(maxsize=10000, ttl=_DECODE_CACHE_TTL)
+_decode_cache_lock = threading.Lock()
+
+# Three dot-separated base64url segments; anything else is rejected before
+# any base64/JSON/HMAC work is done
+_JWT_RE = re.compile(r"[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+")
+
+class _OrjsonPyJWT(jwt.PyJWT):
+    """PyJWT with payload (de)serialization delegated to orjson"""
+
+    def _encode_payload(self, payload, headers=None, json_encoder=None) -> bytes:
+        return orjson.dumps(payload)
+
+    def _decode_payload(self, decoded: dict) -> dict:
+        try:
+            payload = orjson.loads(decoded["payload"])
+        except orjson.JSONDecodeError as e:
+            raise jwt.DecodeError(f"Invalid payload string: {e}") from e
+        if not isinstance(payload, dict):
+            raise jwt.DecodeError("Invalid payload string: must be a json object")
+        return payload
+
+# Shared codec instance and options so each decode skips re-building them
+_pyjwt = _OrjsonPyJWT()
+_DECODE_OPTIONS = {"require": ["exp", "iat", "user_id"]}
+
+# Header fields the HS256 fast path understands; anything else goes to PyJWT
+_FAST_PATH_HEADER_KEYS = frozenset({"alg", "typ"})
+
+def _b64url_decode(segment: bytes) -> bytes:
+    return base64.urlsafe_b64decode(segment + b"=" * (-len(segment) % 4))
+
+def _fast_verify_hs256(token: str, key: bytes) -> Optional[dict]:
+    """Verify a plain HS256 token with a direct HMAC check.
+
+    Raises the same PyJWT exceptions as jwt.decode. Returns None when the
+    token uses headers or claims this path does not handle, so the caller
+    can fall back to PyJWT.
+    """
+    signing_input, _, signature_segment = token.encode().rpartition(b".")
+    header_segment, _, payload_segment = signing_input.partition(b".")
+    try:
+        header = orjson.loads(_b64url_decode(header_segment))
+        signature = _b64url_decode(signature_segment)
+    except (binascii.Error, orjson.JSONDecodeError) as e:
+        raise jwt.DecodeError(f"Invalid header or signature: {e}") from e
+
+    if (not isinstance(header, dict) or header.get("alg") != "HS256"
+            or not header.keys() <= _FAST_PATH_HEADER_KEYS):
+        return None
+
+    expected = hmac.new(key, signing_input, hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, signature):
+        raise jwt.InvalidSignatureError("Signature verification failed")
+
+    try:
+        payload = orjson.loads(_b64url_decode(payload_segment))
+    except (binascii.Error, orjson.JSONDecodeError) as e:
+        raise jwt.DecodeError(f"Invalid payload string: {e}") from e
+    if not isinstance(payload, dict):
+        raise jwt.DecodeError("Invalid payload string: must be a json object")
+    if "nbf" in payload or "aud" in payload:
+        return None
+
+    for claim in _DECODE_OPTIONS["require"]:
+        if payload.get(claim) is None:
+            raise jwt.MissingRequiredClaimError(claim)
+    # PyJWT coerces strings and floats with int(), e.g. "123" or 1.5; leave those to it
+    if isinstance(payload["iat"], (str, float)) or isinstance(payload["exp"], (str, float)):
+        return None
+    if not isinstance(payload["iat"], int):
+        raise jwt.InvalidIssuedAtError("Issued At claim (iat) must be an integer.")
+    if not isinstance(payload["exp"], int):
+        raise jwt.DecodeError("Expiration Time claim (exp) must be an integer.")
+
+    now = time.time()
+    if payload["exp"] <= now:
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    if payload["iat"] > now:
+        raise jwt.ImmatureSignatureError("The token is not yet valid (iat)")
+    return payload
+
+# Hashes created before the argon2id migration
+_BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
 
 class AuthService:
     def __init__(self):
         self.secret_key = settings.JWT_SECRET_KEY
         self.algorithm = settings.JWT_ALGORITHM
         self.expiration_hours = settings.JWT_EXPIRATION_HOURS
+        self._expiration_seconds = self.expiration_hours * 3600
+        self._secret_bytes = self.secret_key.encode()
+        self._algorithms = (self.algorithm,)
+        self._fast_hs256 = self.algorithm == "HS256"
+        # argon2id tuned to roughly 50ms per hash
+        self._hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+        # Verified against when the username does not exist, so unknown and
+        # known usernames cost the same amount of hashing work
+        self._dummy_hash = self._hasher.hash(secrets.token_urlsafe(16))
+        # Dedicated, bounded pool so password hashing never blocks the event
+        # loop and concurrent logins cannot starve the default executor
+        self._password_executor = ThreadPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            thread_name_prefix="password-hash"
+        )
 
-    def hash_password(self, password: str) -> str:
-        """Hash a password using bcrypt"""
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+    async def hash_password(self, password: str) -> str:
+        """Hash a password using argon2id"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._password_executor, self._hasher.hash, password
+        )
 
-    def verify_password(self, password: str, hashed_password: str) -> bool:
+    async def verify_password(self, password: str, hashed_password: str) -> bool:
         """Verify a password against its hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._password_executor, self._verify_password_sync, password, hashed_password
+        )
+
+    async def verify_dummy_password(self, password: str) -> None:
+        """Run a password check that always fails, to mask missing users"""
+        await self.verify_password(password, self._dummy_hash)
+
+    def _verify_password_sync(self, password: str, hashed_password: str) -> bool:
+        """Verify a password against an argon2id or legacy bcrypt hash"""
+        if hashed_password.startswith(_BCRYPT_PREFIXES):
+            return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+        try:
+            return self._hasher.verify(hashed_password, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Check whether a stored hash should be upgraded to the current parameters"""
+        if hashed_password.startswith(_BCRYPT_PREFIXES):
+            return True
+        return self._hasher.check_needs_rehash(hashed_password)
 
     def create_access_token(self, user_id: int, username: str) -> str:
         """Create a JWT access token"""
-        expire = datetime.now(timezone.utc) + timedelta(hours=self.expiration_hours)
+        now = int(time.time())
         payload = {
             "user_id": user_id,
             "username": username,
-            "exp": expire,
-            "iat": datetime.now(timezone.utc)
+            "exp": now + self._expiration_seconds,
+            "iat": now
         }
-        return jwt.encode(payload, self.secret_key, algorithm=self.algorithm)
+        return _pyjwt.encode(payload, self._secret_bytes, algorithm=self.algorithm)
 
     def decode_token(self, token: str) -> dict:
         """Decode and validate a JWT token"""
+        if not _JWT_RE.fullmatch(token):
+            raise CustomHTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token",
+                error_code="INVALID_TOKEN"
+            )
+
+        cache_key = hashlib.sha256(token.encode()).digest()
+        with _decode_cache_lock:
+            payload = _decode_cache.get(cache_key)
+
+        if payload is not None:
+            # Cached entries must not outlive the token itself
+            if payload.get("exp", 0) > time.time():
+                return payload
+            with _decode_cache_lock:
+                _decode_cache.pop(cache_key, None)
+
         try:
-            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
-            return payload
+            payload = None
+            if self._fast_hs256:
+                payload = _fast_verify_hs256(token, self._secret_bytes)
+            if payload is None:
+                payload = _pyjwt.decode(
+                    token, self._secret_bytes, algorithms=self._algorithms, options=_DECODE_OPTIONS
+                )
         except jwt.ExpiredSignatureError:
             raise CustomHTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token has expired",
                 error_code="TOKEN_EXPIRED"
             )
-        except jwt.InvalidTokenError:
+        except (jwt.InvalidTokenError, TypeError, ValueError):
+            # PyJWT's claim checks raise TypeError for values such as "nbf": [1]
             raise CustomHTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token",
                 error_code="INVALID_TOKEN"
             )
 
+        # Only successfully validated tokens are cached
+        with _decode_cache_lock:
+            _decode_cache[cache_key] = payload
+        return payload
+
 auth_service = AuthService()
 
+@dataclass(frozen=True, slots=True)
+class AuthenticatedUser:
+    """Lightweight identity of the caller, resolved without ORM hydration"""
+    id: int
+    username: str
+    tier: SubscriptionTier
+
+def _get_token_user_id(token: str) -> int:
+    """Extract the user id from a validated bearer token"""
+    payload = auth_service.decode_token(token)
+    user_id = payload.get("user_id")
+    
+    if user_id is None:
+        raise CustomHTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token payload",
+            error_code="INVALID_TOKEN_PAYLOAD"
+        )
+    
+    return user_id
+
 async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    request: Request,
+    token: str = Depends(security),
     db: AsyncSession = Depends(get_db)
-) -> User:
+) -> AuthenticatedUser:
     """Get the current authenticated user"""
     try:
-        payload = auth_service.decode_token(credentials.credentials)
-        user_id = payload.get("user_id")
+        user_id = _get_token_user_id(token)
+        
+        cache_service = request.app.state.cache_service
+        cached_user = await cache_service.get("user", user_id=user_id)
+        if cached_user:
+            return AuthenticatedUser(
+                id=cached_user["id"],
+                username=cached_user["username"],
+                tier=SubscriptionTier(cached_user["tier"])
+            )
+        
+        # Fetch only the columns needed for authorization
+        result = await db.execute(
+            select(User.id, User.username, Subscription.tier)
+            .outerjoin(Subscription)
+            .where(User.id == user_id, User.is_active == True)
+        )
+        row = result.first()
         
-        if user_id is None:
+        if row is None:
             raise CustomHTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload",
-                error_code="INVALID_TOKEN_PAYLOAD"
+                detail="User not found or inactive",
+                error_code="USER_NOT_FOUND"
             )
         
-        # Get user from database
-        async with db as session:
-            result = await session.execute(
-                select(User).where(User.id == user_id, User.is_active == True)
+        if row.tier is None:
+            raise CustomHTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User subscription not found",
+                error_code="SUBSCRIPTION_NOT_FOUND"
             )
-            user = result.scalar_one_or_none()
-            
-            if user is None:
-                raise CustomHTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="User not found or inactive",
-                    error_code="USER_NOT_FOUND"
-                )
-            
-            return user
-            
+        
+        current_user = AuthenticatedUser(id=row.id, username=row.username, tier=row.tier)
+        cache_service.set_nowait(
+            "user", asdict(current_user), ttl=settings.USER_CACHE_TTL, user_id=user_id
+        )
+        
+        return current_user
+        
     except CustomHTTPException:
         raise
     except Exception as e:
@@ -102,23 +327,41 @@ async def get_current_user(
         )
 
 async def get_user_with_subscription(
-    current_user: User = Depends(get_current_user),
+    token: str = Depends(security),
     db: AsyncSession = Depends(get_db)
 ) -> tuple[User, Subscription]:
-    """Get current user with their subscription"""
-    async with db as session:
-        result = await session.execute(
-            select(User, Subscription)
-            .join(Subscription)
-            .where(User.id == current_user.id)
-        )
-        user_subscription = result.first()
+    """Get current user with their subscription as ORM objects"""
+    try:
+        user_id = _get_token_user_id(token)
         
-        if user_subscription is None:
-            raise CustomHTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User subscription not found",
-                error_code="SUBSCRIPTION_NOT_FOUND"
-            )
+        result = await db.execute(
+            select(User)
+            .options(joinedload(User.subscription))
+            .where(User.id == user_id, User.is_active == True)
+        )
+        user = result.scalar_one_or_none()
         
-        return user_subscription[0], user_subscription[1]
+    except CustomHTTPException:
+        raise
+    except Exception as e:
+        raise CustomHTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication failed",
+            error_code="AUTH_FAILED"
+        )
+    
+    if user is None:
+        raise CustomHTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found or inactive",
+            error_code="USER_NOT_FOUND"
+        )
+    
+    if user.subscription is None:
+        raise CustomHTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User subscription not found",
+            error_code="SUBSCRIPTION_NOT_FOUND"
+        )
+    
+    return user, user.subscription
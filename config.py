@@ -4,6 +4,15 @@ from typing import Optional
 class Settings:
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///stock_analysis.db")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "50"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "50"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "5"))  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # 30 minutes
+    DB_STATEMENT_CACHE_SIZE: int = 1024
+    # Statement logging for local debugging only
+    SQL_ECHO: bool = os.getenv("SQL_ECHO", "false").lower() == "true"
+    # Set when connecting through pgbouncer in transaction pooling mode
+    DB_PGBOUNCER: bool = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
     
     # JWT
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
@@ -12,18 +21,31 @@ class Settings:
     
     # Redis Cache
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
     CACHE_TTL: int = 300  # 5 minutes
+    USER_CACHE_TTL: int = 60  # Authenticated user lookups
+    INDICATOR_CACHE_TTL: int = 86400  # Keys include the last bar date, so new data never hits stale entries
+    CACHE_BATCH_WINDOW_MS: float = 1.0  # Coalescing window for pipelined GET/SETEX
+    CACHE_L1_SIZE: int = 1024  # Per-worker in-process entries in front of Redis
+    CACHE_L1_TTL: int = 30  # Upper bound on how stale a worker's local copy can be
+    CACHE_MAX_PENDING_WRITES: int = 512  # Fire-and-forget writes beyond this are dropped
     
     # Rate Limiting
     RATE_LIMIT_FREE: int = 50
     RATE_LIMIT_PRO: int = 500
     RATE_LIMIT_PREMIUM: int = 10000  # Effectively unlimited
+    RATE_LIMIT_FLUSH_INTERVAL_MS: int = 500  # Database counters are written in batches this often
+    RATE_LIMIT_FLUSH_MAX_RETRIES: int = 10  # Failed batches are re-queued this many times, then dropped
     
     # Data Access Periods (in days)
     DATA_ACCESS_FREE: int = 90  # 3 months
     DATA_ACCESS_PRO: int = 365  # 1 year
     DATA_ACCESS_PREMIUM: int = 1095  # 3 years
     
+    # Indicators
+    INDICATOR_FLOAT32_MIN_ROWS: int = 50000  # Longer series compute on float32 close prices
+    INDICATOR_NUMBA_MIN_ROWS: int = 50000  # Longer series use the compiled RSI kernel
+    
     # File paths
     PARQUET_DATA_PATH: str = os.getenv("PARQUET_DATA_PATH", "./attached_assets/stocks_ohlc_data_1751553774887.parquet")
     
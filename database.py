@@ -1,32 +1,64 @@
 import os
 import logging
+from uuid import uuid4
+from sqlalchemy import Integer, inspect, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from contextlib import asynccontextmanager
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from config import settings
 
 # Database configuration
 if 'sqlite' in settings.DATABASE_URL:
     # SQLite configuration
-    SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./stock_analysis.db"
+    SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
+    if SQLALCHEMY_DATABASE_URL.startswith("sqlite://"):
+        SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace(
+            "sqlite://", "sqlite+aiosqlite://", 1
+        )
     engine = create_async_engine(
         SQLALCHEMY_DATABASE_URL,
         connect_args={"check_same_thread": False},
-        echo=True
+        echo=settings.SQL_ECHO,
+        echo_pool=False
     )
 else:
     # PostgreSQL configuration
     SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL.replace(
         "postgresql://", "postgresql+asyncpg://"
     )
+    if settings.DB_PGBOUNCER:
+        # Named prepared statements do not survive across pgbouncer
+        # transactions, so disable caching and give each statement a unique name
+        connect_args = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__"
+        }
+    else:
+        connect_args = {
+            # asyncpg protocol-level and SQLAlchemy dialect-level prepared statement caches
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE // 2,
+            # Short OLTP queries never benefit from JIT compilation
+            "server_settings": {"jit": "off"}
+        }
     engine = create_async_engine(
         SQLALCHEMY_DATABASE_URL,
-        pool_size=10,
-        max_overflow=20,
-        pool_pre_ping=True,
-        pool_recycle=300,
-        echo=True
+        # Pin the pooled, asyncio-aware queue pool so connections are always reused
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        # Fail fast when the pool is exhausted instead of queueing requests for 30s
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        # Recycling replaces the per-checkout SELECT 1 of pool_pre_ping
+        pool_pre_ping=False,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        connect_args=connect_args,
+        echo=settings.SQL_ECHO,
+        echo_pool=False
     )
 
 # Create session factory
@@ -39,6 +71,12 @@ async_session = async_sessionmaker(
 class Base(DeclarativeBase):
     pass
 
+def dialect_insert(model):
+    """Build an INSERT for the configured backend that supports ON CONFLICT clauses"""
+    if engine.dialect.name == "postgresql":
+        return postgresql_insert(model)
+    return sqlite_insert(model)
+
 async def init_db():
     """Initialize database tables"""
     try:
@@ -46,17 +84,78 @@ async def init_db():
             # Import models to ensure they're registered
             from models import User, Subscription, RateLimit
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_upgrade_schema)
         logging.info("Database tables created successfully")
     except Exception as e:
         logging.error(f"Error creating database tables: {e}")
         raise
 
-@asynccontextmanager
+def _upgrade_schema(conn):
+    """Bring tables created by earlier versions in line with the models
+    
+    create_all skips tables that already exist, so column changes and new
+    indexes are applied here. Every step is a no-op once applied.
+    """
+    inspector = inspect(conn)
+    
+    # rate_limits.window_start was a midnight UTC timestamp; it is now epoch seconds
+    window_start = next(
+        column for column in inspector.get_columns("rate_limits")
+        if column["name"] == "window_start"
+    )
+    if not isinstance(window_start["type"], Integer):
+        if conn.dialect.name == "postgresql":
+            conn.execute(text(
+                "ALTER TABLE rate_limits ALTER COLUMN window_start TYPE BIGINT "
+                "USING (floor(extract(epoch FROM window_start) / 86400) * 86400)::bigint"
+            ))
+        else:
+            # SQLite keeps the declared type but stores whatever it is given
+            conn.execute(text(
+                "UPDATE rate_limits "
+                "SET window_start = CAST(strftime('%s', window_start) AS INTEGER) / 86400 * 86400 "
+                "WHERE typeof(window_start) = 'text'"
+            ))
+    
+    existing = {
+        table: {index["name"] for index in inspector.get_indexes(table)}
+        for table in inspector.get_table_names()
+    }
+    
+    if "uq_rate_limits_user_endpoint_window" not in existing["rate_limits"]:
+        # Older versions could leave several rows per window; fold them into
+        # the lowest id so the unique counter index can be built
+        conn.execute(text(
+            "UPDATE rate_limits SET requests_count = ("
+            "SELECT SUM(d.requests_count) FROM rate_limits d "
+            "WHERE d.user_id = rate_limits.user_id AND d.endpoint = rate_limits.endpoint "
+            "AND d.window_start = rate_limits.window_start"
+            ") WHERE id IN ("
+            "SELECT MIN(id) FROM rate_limits GROUP BY user_id, endpoint, window_start "
+            "HAVING COUNT(*) > 1)"
+        ))
+        conn.execute(text(
+            "DELETE FROM rate_limits WHERE id NOT IN ("
+            "SELECT MIN(id) FROM rate_limits GROUP BY user_id, endpoint, window_start)"
+        ))
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing.get(table.name, set()):
+                index.create(conn)
+                logging.info(f"Created index {index.name}")
+
 async def get_db():
-    """Get database session"""
+    """Get database session
+    
+    Writes still pending when the handler returns are committed; any error,
+    including an HTTP error response, rolls them back. Routes that must make
+    writes durable before responding (e.g. issuing a token) commit themselves.
+    """
     async with async_session() as session:
         try:
             yield session
+            await session.commit()
         except Exception as e:
             await session.rollback()
             raise
@@ -7,7 +7,7 @@ from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 
-from database import init_db, get_db
+from database import async_session, init_db, get_db
 from models import User, Subscription
 from routes.auth_routes import auth_router
 from routes.indicators_routes import indicators_router
@@ -15,6 +15,7 @@ from utils.exceptions import CustomHTTPException
 from utils.logging_config import setup_logging
 from services.cache_service import CacheService
 from services.data_service import DataService
+from services.rate_limiter import rate_limiter
 
 
 @asynccontextmanager
@@ -31,6 +32,10 @@ async def lifespan(app: FastAPI):
     cache_service = CacheService()
     app.state.cache_service = cache_service
     
+    # Rate limiting runs in Redis when available, otherwise in the database
+    await rate_limiter.initialize(cache_service.redis_client, async_session)
+    rate_limiter.counters.start()
+    
     # Initialize data service
     data_service = DataService()
     await data_service.load_data()
@@ -42,6 +47,7 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logging.info("Shutting down application")
+    await rate_limiter.counters.stop()
 
 
 app = FastAPI(
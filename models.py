@@ -1,6 +1,7 @@
+import time
 from datetime import datetime, timezone
 from typing import Optional
-from sqlalchemy import String, Integer, DateTime, Boolean, Enum as SQLEnum, Float, ForeignKey
+from sqlalchemy import String, Integer, BigInteger, DateTime, Boolean, Enum as SQLEnum, Float, ForeignKey, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 import enum
 
@@ -13,6 +14,17 @@ class SubscriptionTier(str, enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Login looks up active users by username; the INCLUDE columns let
+        # PostgreSQL answer it with an index-only scan
+        Index(
+            "ix_users_username_active",
+            "username",
+            postgresql_where=text("is_active"),
+            postgresql_include=["id", "hashed_password"],
+            sqlite_where=text("is_active")
+        ),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
@@ -28,6 +40,10 @@ class User(Base):
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        # Every authenticated request joins users to their subscription tier
+        Index("ix_subscriptions_user_id", "user_id", postgresql_include=["tier"]),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
@@ -42,12 +58,23 @@ class Subscription(Base):
 
 class RateLimit(Base):
     __tablename__ = "rate_limits"
+    __table_args__ = (
+        # Conflict target for the per-window counter upsert; on PostgreSQL the
+        # count rides in the index so counter lookups are index-only scans
+        Index(
+            "uq_rate_limits_user_endpoint_window",
+            "user_id", "endpoint", "window_start",
+            unique=True,
+            postgresql_include=["requests_count"]
+        ),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
     endpoint: Mapped[str] = mapped_column(String(100), nullable=False)
     requests_count: Mapped[int] = mapped_column(Integer, default=0)
-    window_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    # Start of the UTC day the counter covers, in epoch seconds
+    window_start: Mapped[int] = mapped_column(BigInteger, default=lambda: int(time.time()) // 86400 * 86400)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     
     # Relationships
@@ -1,10 +1,10 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from datetime import datetime, timezone
 
-from database import get_db
+from database import get_db, dialect_insert
 from models import User, Subscription, SubscriptionTier
 from schemas.auth_schemas import (
     UserCreate, UserLogin, LoginResponse, UserResponse, 
@@ -16,70 +16,73 @@ from utils.exceptions import CustomHTTPException
 auth_router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Upgrade ordering of subscription tiers
+_TIER_RANK = {
+    SubscriptionTier.FREE: 0,
+    SubscriptionTier.PRO: 1,
+    SubscriptionTier.PREMIUM: 2
+}
+
 @auth_router.post("/register", response_model=LoginResponse)
 async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
     try:
-        async with db as session:
-            # Check if username already exists
-            result = await session.execute(
-                select(User).where(User.username == user_data.username)
+        # Insert the user, letting the unique constraints detect collisions
+        hashed_password = await auth_service.hash_password(user_data.password)
+        result = await db.execute(
+            dialect_insert(User)
+            .values(
+                username=user_data.username,
+                email=user_data.email,
+                hashed_password=hashed_password
+            )
+            .on_conflict_do_nothing()
+            .returning(User)
+        )
+        new_user = result.scalar_one_or_none()
+        
+        if new_user is None:
+            # Nothing was inserted; find out which field collided
+            result = await db.execute(
+                select(User.username).where(User.username == user_data.username)
             )
-            if result.scalar_one_or_none():
+            if result.first() is not None:
                 raise CustomHTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Username already exists",
                     error_code="USERNAME_EXISTS"
                 )
-            
-            # Check if email already exists
-            result = await session.execute(
-                select(User).where(User.email == user_data.email)
-            )
-            if result.scalar_one_or_none():
-                raise CustomHTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Email already exists",
-                    error_code="EMAIL_EXISTS"
-                )
-            
-            # Create new user
-            hashed_password = auth_service.hash_password(user_data.password)
-            new_user = User(
-                username=user_data.username,
-                email=user_data.email,
-                hashed_password=hashed_password
-            )
-            session.add(new_user)
-            await session.flush()  # Get the user ID
-            
-            # Create default subscription (Free tier)
-            subscription = Subscription(
-                user_id=new_user.id,
-                tier=SubscriptionTier.FREE,
-                is_active=True
-            )
-            session.add(subscription)
-            await session.commit()
-            
-            # Refresh to get all data
-            await session.refresh(new_user)
-            await session.refresh(subscription)
-            
-            # Generate token
-            access_token = auth_service.create_access_token(
-                user_id=new_user.id,
-                username=new_user.username
-            )
-            
-            logger.info(f"User registered successfully: {new_user.username}")
-            
-            return LoginResponse(
-                access_token=access_token,
-                user=UserResponse.model_validate(new_user),
-                subscription=SubscriptionResponse.model_validate(subscription)
+            raise CustomHTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already exists",
+                error_code="EMAIL_EXISTS"
             )
-            
+        
+        # Create default subscription (Free tier); the user row came back
+        # fully populated from RETURNING and the subscription is flushed
+        # with the commit, so neither needs a refresh round-trip
+        subscription = Subscription(
+            user=new_user,
+            tier=SubscriptionTier.FREE,
+            is_active=True
+        )
+        db.add(subscription)
+        await db.commit()
+        
+        # Generate token
+        access_token = auth_service.create_access_token(
+            user_id=new_user.id,
+            username=new_user.username
+        )
+        
+        logger.info(f"User registered successfully: {new_user.username}")
+        
+        return LoginResponse(
+            access_token=access_token,
+            user=UserResponse.model_validate(new_user),
+            subscription=SubscriptionResponse.model_validate(subscription)
+        )
+        
     except CustomHTTPException:
         raise
     except Exception as e:
@@ -94,46 +97,51 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
 async def login(login_data: UserLogin, db: AsyncSession = Depends(get_db)):
     """Authenticate user and return token"""
     try:
-        async with db as session:
-            # Get user by username
-            result = await session.execute(
-                select(User, Subscription)
-                .join(Subscription)
-                .where(User.username == login_data.username, User.is_active == True)
-            )
-            user_subscription = result.first()
-            
-            if not user_subscription:
-                raise CustomHTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid username or password",
-                    error_code="INVALID_CREDENTIALS"
-                )
-            
-            user, subscription = user_subscription
-            
-            # Verify password
-            if not auth_service.verify_password(login_data.password, user.hashed_password):
-                raise CustomHTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid username or password",
-                    error_code="INVALID_CREDENTIALS"
-                )
-            
-            # Generate token
-            access_token = auth_service.create_access_token(
-                user_id=user.id,
-                username=user.username
+        # Get user by username
+        result = await db.execute(
+            select(User, Subscription)
+            .join(Subscription)
+            .where(User.username == login_data.username, User.is_active == True)
+        )
+        user_subscription = result.first()
+        
+        if not user_subscription:
+            await auth_service.verify_dummy_password(login_data.password)
+            raise CustomHTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid username or password",
+                error_code="INVALID_CREDENTIALS"
             )
-            
-            logger.info(f"User logged in successfully: {user.username}")
-            
-            return LoginResponse(
-                access_token=access_token,
-                user=UserResponse.model_validate(user),
-                subscription=SubscriptionResponse.model_validate(subscription)
+        
+        user, subscription = user_subscription
+        
+        # Verify password
+        if not await auth_service.verify_password(login_data.password, user.hashed_password):
+            raise CustomHTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid username or password",
+                error_code="INVALID_CREDENTIALS"
             )
-            
+        
+        # Upgrade legacy bcrypt hashes to argon2id on successful login
+        if auth_service.needs_rehash(user.hashed_password):
+            user.hashed_password = await auth_service.hash_password(login_data.password)
+            await db.commit()
+        
+        # Generate token
+        access_token = auth_service.create_access_token(
+            user_id=user.id,
+            username=user.username
+        )
+        
+        logger.info(f"User logged in successfully: {user.username}")
+        
+        return LoginResponse(
+            access_token=access_token,
+            user=UserResponse.model_validate(user),
+            subscription=SubscriptionResponse.model_validate(subscription)
+        )
+        
     except CustomHTTPException:
         raise
     except Exception as e:
@@ -162,6 +170,7 @@ async def get_current_user_info(
 @auth_router.post("/upgrade", response_model=SubscriptionResponse)
 async def upgrade_subscription(
     tier: SubscriptionTier,
+    request: Request,
     user_subscription: tuple = Depends(get_user_with_subscription),
     db: AsyncSession = Depends(get_db)
 ):
@@ -170,35 +179,33 @@ async def upgrade_subscription(
         user, subscription = user_subscription
         
         # Validate tier upgrade
-        tier_order = [SubscriptionTier.FREE, SubscriptionTier.PRO, SubscriptionTier.PREMIUM]
-        current_tier_index = tier_order.index(subscription.tier)
-        new_tier_index = tier_order.index(tier)
-        
-        if new_tier_index <= current_tier_index:
+        if _TIER_RANK[tier] <= _TIER_RANK[subscription.tier]:
             raise CustomHTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Can only upgrade to a higher tier",
                 error_code="INVALID_TIER_UPGRADE"
             )
         
-        async with db as session:
-            # Update subscription
-            subscription.tier = tier
-            subscription.updated_at = datetime.now(timezone.utc)
-            
-            # Set expiration for premium tier (for demo purposes)
-            if tier == SubscriptionTier.PREMIUM:
-                from datetime import timedelta
-                subscription.expires_at = datetime.now(timezone.utc) + timedelta(days=365)
-            
-            session.add(subscription)
-            await session.commit()
-            await session.refresh(subscription)
-            
-            logger.info(f"User {user.username} upgraded to {tier.value} tier")
-            
-            return SubscriptionResponse.model_validate(subscription)
-            
+        # Update subscription
+        subscription.tier = tier
+        subscription.updated_at = datetime.now(timezone.utc)
+        
+        # Set expiration for premium tier (for demo purposes)
+        if tier == SubscriptionTier.PREMIUM:
+            from datetime import timedelta
+            subscription.expires_at = datetime.now(timezone.utc) + timedelta(days=365)
+        
+        db.add(subscription)
+        await db.commit()
+        await db.refresh(subscription)
+        
+        # Drop the cached identity so the new tier applies immediately
+        await request.app.state.cache_service.delete("user", user_id=user.id)
+        
+        logger.info(f"User {user.username} upgraded to {tier.value} tier")
+        
+        return SubscriptionResponse.model_validate(subscription)
+        
     except CustomHTTPException:
         raise
     except Exception as e:
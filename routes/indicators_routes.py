@@ -1,27 +1,53 @@
 import logging
-from typing import List
+import polars as pl
+from datetime import date
+from typing import Dict, FrozenSet
 from fastapi import APIRouter, Depends, Request, Header
+from fastapi.responses import Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from config import settings
 from database import get_db
-from auth import get_user_with_subscription
-from models import User, Subscription, SubscriptionTier
+from auth import AuthenticatedUser, get_current_user
+from models import SubscriptionTier
 from schemas.indicator_schemas import (
     IndicatorRequest, IndicatorResponse, AvailableSymbolsResponse,
-    StockDataResponse, StockDataPoint, IndicatorType
+    StockDataResponse, IndicatorType
 )
 from services.technical_indicators import TechnicalIndicatorService
 from services.data_service import DataService
 from services.cache_service import CacheService
-from services.rate_limiter import RateLimiterService
+from services.rate_limiter import rate_limiter
 from utils.exceptions import CustomHTTPException
+from utils.serialization import json_with_rows
 
 indicators_router = APIRouter()
 logger = logging.getLogger(__name__)
 
 # Initialize services
 technical_service = TechnicalIndicatorService()
-rate_limiter = RateLimiterService()
+
+# Indicators available to each subscription tier
+_ALLOWED_INDICATORS: Dict[SubscriptionTier, FrozenSet[IndicatorType]] = {
+    SubscriptionTier.FREE: frozenset({IndicatorType.SMA, IndicatorType.EMA}),
+    SubscriptionTier.PRO: frozenset({
+        IndicatorType.SMA, IndicatorType.EMA, IndicatorType.RSI, IndicatorType.MACD
+    }),
+    SubscriptionTier.PREMIUM: frozenset(IndicatorType)
+}
+
+# Calculation parameter name -> IndicatorRequest attribute, per indicator
+_PARAM_FIELDS: Dict[IndicatorType, Dict[str, str]] = {
+    IndicatorType.SMA: {"period": "window_or_period"},
+    IndicatorType.EMA: {"period": "window_or_period"},
+    IndicatorType.RSI: {"period": "period"},
+    IndicatorType.MACD: {
+        "fast_period": "fast_period",
+        "slow_period": "slow_period",
+        "signal_period": "signal_period"
+    },
+    IndicatorType.BOLLINGER_BANDS: {"period": "period", "std_dev": "std_dev"}
+}
 
 def get_data_service(request: Request) -> DataService:
     return request.app.state.data_service
@@ -32,16 +58,14 @@ def get_cache_service(request: Request) -> CacheService:
 @indicators_router.get("/symbols", response_model=AvailableSymbolsResponse)
 async def get_available_symbols(
     data_service: DataService = Depends(get_data_service),
-    user_subscription: tuple = Depends(get_user_with_subscription),
+    current_user: AuthenticatedUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Get list of available stock symbols"""
     try:
-        user, subscription = user_subscription
-        
         # Check rate limit
         is_allowed, rate_info = await rate_limiter.check_rate_limit(
-            user, subscription, "symbols", db
+            current_user, "symbols", db
         )
         
         if not is_allowed:
@@ -51,11 +75,9 @@ async def get_available_symbols(
                 error_code="RATE_LIMIT_EXCEEDED"
             )
         
-        symbols = data_service.get_available_symbols()
-        
-        return AvailableSymbolsResponse(
-            symbols=symbols,
-            count=len(symbols)
+        return Response(
+            content=data_service.get_available_symbols_response(),
+            media_type="application/json"
         )
         
     except CustomHTTPException:
@@ -75,18 +97,14 @@ async def get_stock_data(
     end_date: str,
     data_service: DataService = Depends(get_data_service),
     cache_service: CacheService = Depends(get_cache_service),
-    user_subscription: tuple = Depends(get_user_with_subscription),
+    current_user: AuthenticatedUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Get raw stock data for a symbol"""
     try:
-        from datetime import datetime
-        
-        user, subscription = user_subscription
-        
         # Check rate limit
         is_allowed, rate_info = await rate_limiter.check_rate_limit(
-            user, subscription, "stock_data", db
+            current_user, "stock_data", db
         )
         
         if not is_allowed:
@@ -97,53 +115,40 @@ async def get_stock_data(
             )
         
         # Parse dates
-        start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-        end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
+        start_date_obj = date.fromisoformat(start_date)
+        end_date_obj = date.fromisoformat(end_date)
         
         # Validate date range for subscription tier
         data_service.validate_date_range_for_tier(
-            start_date_obj, end_date_obj, subscription.tier.value
+            start_date_obj, end_date_obj, current_user.tier.value
         )
         
-        # Check cache first
         cache_key_params = {
             "symbol": symbol,
             "start_date": start_date,
             "end_date": end_date
         }
-        cached_data = await cache_service.get("stock_data", **cache_key_params)
-        
-        if cached_data:
-            logger.info(f"Returning cached stock data for {symbol}")
-            return StockDataResponse(**cached_data)
         
-        # Get data from service
-        df = data_service.get_stock_data(symbol, start_date_obj, end_date_obj)
-        
-        # Convert to response format
-        stock_data = [
-            StockDataPoint(
-                date=row['date'],
-                open=row['open'],
-                high=row['high'],
-                low=row['low'],
-                close=row['close'],
-                volume=row['volume']
+        async def build_body() -> bytes:
+            df = data_service.get_stock_data(symbol, start_date_obj, end_date_obj)
+            
+            # Serialize straight from the frame, matching the StockDataPoint schema
+            return json_with_rows(
+                {
+                    "symbol": symbol,
+                    "start_date": start_date_obj,
+                    "end_date": end_date_obj
+                },
+                df.select([
+                    "date", "open", "high", "low", "close",
+                    pl.col("volume").cast(pl.Int64)
+                ])
             )
-            for row in df.to_dicts()
-        ]
-        
-        response = StockDataResponse(
-            symbol=symbol,
-            start_date=start_date_obj,
-            end_date=end_date_obj,
-            data=stock_data
-        )
         
-        # Cache the response
-        await cache_service.set("stock_data", response.model_dump(), **cache_key_params)
+        # Served from cache, or computed once for all concurrent identical requests
+        body = await cache_service.get_or_compute("stock_data", build_body, **cache_key_params)
         
-        return response
+        return Response(content=body, media_type="application/json")
         
     except CustomHTTPException:
         raise
@@ -166,16 +171,14 @@ async def calculate_indicator(
     request_data: IndicatorRequest,
     data_service: DataService = Depends(get_data_service),
     cache_service: CacheService = Depends(get_cache_service),
-    user_subscription: tuple = Depends(get_user_with_subscription),
+    current_user: AuthenticatedUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Calculate technical indicator for a stock"""
     try:
-        user, subscription = user_subscription
-        
         # Check rate limit
         is_allowed, rate_info = await rate_limiter.check_rate_limit(
-            user, subscription, "calculate_indicator", db
+            current_user, "calculate_indicator", db
         )
         
         if not is_allowed:
@@ -186,84 +189,74 @@ async def calculate_indicator(
             )
         
         # Validate indicator access for subscription tier
-        allowed_indicators = _get_allowed_indicators(subscription.tier)
+        allowed_indicators = _get_allowed_indicators(current_user.tier)
         if request_data.indicator not in allowed_indicators:
             raise CustomHTTPException(
                 status_code=403,
-                detail=f"Indicator {request_data.indicator} not available for {subscription.tier.value} tier",
+                detail=f"Indicator {request_data.indicator} not available for {current_user.tier.value} tier",
                 error_code="INDICATOR_NOT_ALLOWED"
             )
         
         # Validate date range for subscription tier
         data_service.validate_date_range_for_tier(
-            request_data.start_date, request_data.end_date, subscription.tier.value
+            request_data.start_date, request_data.end_date, current_user.tier.value
         )
         
-        # Generate cache key
+        # Prepare parameters
+        parameters = {
+            name: getattr(request_data, field)
+            for name, field in _PARAM_FIELDS[request_data.indicator].items()
+        }
+        
+        # Generate cache key from the parameters the indicator actually uses and
+        # the symbol's latest bar, so reloaded data is never served from a stale entry
         cache_key_params = {
             "symbol": request_data.symbol,
             "start_date": str(request_data.start_date),
             "end_date": str(request_data.end_date),
             "indicator": request_data.indicator.value,
-            "parameters": request_data.model_dump(exclude={"symbol", "start_date", "end_date", "indicator"})
+            "parameters": parameters,
+            "last_bar_date": str(data_service.get_last_bar_date(request_data.symbol))
         }
         
-        # Check cache first
-        cached_data = await cache_service.get("indicator", **cache_key_params)
-        if cached_data:
-            logger.info(f"Returning cached indicator data for {request_data.symbol}")
-            return IndicatorResponse(**cached_data)
-        
-        # Get stock data
-        df = data_service.get_stock_data(
-            request_data.symbol, 
-            request_data.start_date, 
-            request_data.end_date
-        )
-        
-        if df.height == 0:
-            raise CustomHTTPException(
-                status_code=404,
-                detail=f"No data found for symbol {request_data.symbol} in the specified date range",
-                error_code="NO_DATA_FOUND"
+        async def build_body() -> bytes:
+            # Get stock data
+            df = data_service.get_stock_data(
+                request_data.symbol, 
+                request_data.start_date, 
+                request_data.end_date
+            )
+            
+            if df.height == 0:
+                raise CustomHTTPException(
+                    status_code=404,
+                    detail=f"No data found for symbol {request_data.symbol} in the specified date range",
+                    error_code="NO_DATA_FOUND"
+                )
+            
+            # Calculate indicator
+            indicator_df = technical_service.process_indicator_request(
+                df, request_data.indicator, parameters
+            )
+            
+            # Same shape as IndicatorResponse, with the rows written by Polars
+            return json_with_rows(
+                {
+                    "symbol": request_data.symbol,
+                    "indicator": request_data.indicator.value,
+                    "parameters": parameters,
+                    "start_date": request_data.start_date,
+                    "end_date": request_data.end_date
+                },
+                indicator_df
             )
         
-        # Prepare parameters
-        parameters = {}
-        if request_data.indicator in [IndicatorType.SMA, IndicatorType.EMA]:
-            parameters['period'] = request_data.window or request_data.period
-        elif request_data.indicator == IndicatorType.RSI:
-            parameters['period'] = request_data.period
-        elif request_data.indicator == IndicatorType.MACD:
-            parameters.update({
-                'fast_period': request_data.fast_period,
-                'slow_period': request_data.slow_period,
-                'signal_period': request_data.signal_period
-            })
-        elif request_data.indicator == IndicatorType.BOLLINGER_BANDS:
-            parameters.update({
-                'period': request_data.period,
-                'std_dev': request_data.std_dev
-            })
-        
-        # Calculate indicator
-        indicator_data = technical_service.process_indicator_request(
-            df, request_data.indicator, parameters
-        )
-        
-        response = IndicatorResponse(
-            symbol=request_data.symbol,
-            indicator=request_data.indicator,
-            parameters=parameters,
-            start_date=request_data.start_date,
-            end_date=request_data.end_date,
-            data=indicator_data
+        # Served from cache, or computed once for all concurrent identical requests
+        body = await cache_service.get_or_compute(
+            "indicator", build_body, ttl=settings.INDICATOR_CACHE_TTL, **cache_key_params
         )
         
-        # Cache the response
-        await cache_service.set("indicator", response.model_dump(), **cache_key_params)
-        
-        return response
+        return Response(content=body, media_type="application/json")
         
     except CustomHTTPException:
         raise
@@ -277,14 +270,12 @@ async def calculate_indicator(
 
 @indicators_router.get("/rate-limit-status")
 async def get_rate_limit_status(
-    user_subscription: tuple = Depends(get_user_with_subscription),
+    current_user: AuthenticatedUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Get current rate limit status for the user"""
     try:
-        user, subscription = user_subscription
-        
-        status = await rate_limiter.get_user_rate_limit_status(user, subscription, db)
+        status = await rate_limiter.get_user_rate_limit_status(current_user, db)
         return status
         
     except Exception as e:
@@ -295,13 +286,6 @@ async def get_rate_limit_status(
             error_code="RATE_LIMIT_STATUS_ERROR"
         )
 
-def _get_allowed_indicators(tier: SubscriptionTier) -> List[IndicatorType]:
+def _get_allowed_indicators(tier: SubscriptionTier) -> FrozenSet[IndicatorType]:
     """Get allowed indicators for a subscription tier"""
-    if tier == SubscriptionTier.FREE:
-        return [IndicatorType.SMA, IndicatorType.EMA]
-    elif tier == SubscriptionTier.PRO:
-        return [IndicatorType.SMA, IndicatorType.EMA, IndicatorType.RSI, IndicatorType.MACD]
-    elif tier == SubscriptionTier.PREMIUM:
-        return list(IndicatorType)
-    else:
-        return []
+    return _ALLOWED_INDICATORS.get(tier, frozenset())
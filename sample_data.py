@@ -4,7 +4,6 @@ This file creates a sample parquet file if the original is not available
 """
 
 import polars as pl
-import random
 import numpy as np
 from datetime import date, timedelta
 import os
@@ -15,79 +14,66 @@ def create_sample_parquet_data():
     # Stock symbols
     symbols = ["AAPL", "GOOGL", "MSFT", "TSLA", "AMZN", "META", "NVDA", "JPM", "JNJ", "V"]
     
-    # Date range (3 years)
-    start_date = date.today() - timedelta(days=1095)
-    dates = []
+    # Starting price for each symbol
+    base_prices = {
+        "AAPL": 150.0,
+        "GOOGL": 2800.0,
+        "MSFT": 330.0,
+        "TSLA": 200.0,
+        "AMZN": 3300.0,
+        "META": 350.0,
+        "NVDA": 250.0,
+        "JPM": 140.0,
+        "JNJ": 160.0,
+        "V": 220.0
+    }
     
-    # Generate weekday dates only
-    for i in range(1095):
-        current_date = start_date + timedelta(days=i)
-        if current_date.weekday() < 5:  # Monday = 0, Sunday = 6
-            dates.append(current_date)
+    # Date range (3 years), weekday dates only
+    start_date = np.datetime64(date.today() - timedelta(days=1095), "D")
+    dates = np.arange(start_date, start_date + 1095)
+    dates = dates[np.is_busday(dates)]
+    n = len(dates)
     
-    # Generate data
-    data_rows = []
+    rng = np.random.default_rng()
+    columns = {"open": [], "high": [], "low": [], "close": [], "volume": []}
     
     for symbol in symbols:
-        # Starting price for each symbol
-        base_prices = {
-            "AAPL": 150.0,
-            "GOOGL": 2800.0,
-            "MSFT": 330.0,
-            "TSLA": 200.0,
-            "AMZN": 3300.0,
-            "META": 350.0,
-            "NVDA": 250.0,
-            "JPM": 140.0,
-            "JNJ": 160.0,
-            "V": 220.0
-        }
-        
         base_price = base_prices.get(symbol, 100.0)
         
-        for i, date_val in enumerate(dates):
-            # Generate realistic price movements
-            if i == 0:
-                open_price = base_price
-            else:
-                # Get previous close
-                prev_close = data_rows[-1]['close'] if data_rows and data_rows[-1]['symbol'] == symbol else base_price
-                
-                # Add some trend and volatility
-                trend = random.uniform(-0.002, 0.003)  # Slight upward bias
-                volatility = random.uniform(-0.05, 0.05)  # Daily volatility
-                
-                price_change = prev_close * (trend + volatility)
-                open_price = max(prev_close + price_change, 1.0)
-            
-            # Generate OHLC
-            daily_volatility = random.uniform(0.01, 0.04)
-            high_multiplier = 1 + random.uniform(0, daily_volatility)
-            low_multiplier = 1 - random.uniform(0, daily_volatility)
-            
-            close_change = random.uniform(-daily_volatility/2, daily_volatility/2)
-            close_price = max(open_price * (1 + close_change), 1.0)
-            
-            high_price = max(open_price, close_price) * high_multiplier
-            low_price = min(open_price, close_price) * low_multiplier
-            
-            # Generate volume
-            base_volume = random.randint(500000, 5000000)
-            volume_multiplier = random.uniform(0.5, 2.0)
-            volume = int(base_volume * volume_multiplier)
-            
-            data_rows.append({
-                'date': date_val,
-                'symbol': symbol,
-                'open': round(open_price, 2),
-                'high': round(high_price, 2),
-                'low': round(low_price, 2),
-                'close': round(close_price, 2),
-                'volume': volume
-            })
+        # Overnight move: slight upward trend plus daily volatility; the first bar opens at base price
+        overnight = rng.uniform(-0.002, 0.003, n) + rng.uniform(-0.05, 0.05, n)
+        overnight[0] = 0.0
+        
+        # Intraday move from open to close
+        daily_volatility = rng.uniform(0.01, 0.04, n)
+        close_change = rng.uniform(-0.5, 0.5, n) * daily_volatility
+        
+        # Each open follows the previous close, so prices compound over both moves
+        close_price = np.maximum(base_price * np.cumprod((1 + overnight) * (1 + close_change)), 1.0)
+        open_price = np.maximum(close_price / (1 + close_change), 1.0)
+        
+        high_price = np.maximum(open_price, close_price) * (1 + rng.uniform(0, 1, n) * daily_volatility)
+        low_price = np.minimum(open_price, close_price) * (1 - rng.uniform(0, 1, n) * daily_volatility)
+        
+        # Generate volume
+        volume = (rng.integers(500000, 5000000, n, endpoint=True) * rng.uniform(0.5, 2.0, n)).astype(np.int64)
+        
+        columns["open"].append(open_price)
+        columns["high"].append(high_price)
+        columns["low"].append(low_price)
+        columns["close"].append(close_price)
+        columns["volume"].append(volume)
     
-    # Create DataFrame and save
-    df = pl.DataFrame(data_rows)
+    # Create DataFrame, one block of dates per symbol
+    df = pl.DataFrame({
+        "date": np.tile(dates, len(symbols)),
+        "symbol": np.repeat(symbols, n),
+        "open": np.round(np.concatenate(columns["open"]), 2),
+        "high": np.round(np.concatenate(columns["high"]), 2),
+        "low": np.round(np.concatenate(columns["low"]), 2),
+        "close": np.round(np.concatenate(columns["close"]), 2),
+        "volume": np.concatenate(columns["volume"])
+    })
     
     # Ensure directory exists
     os.makedirs("attached_assets", exist_ok=True)
@@ -96,9 +82,9 @@ def create_sample_parquet_data():
     output_path = "attached_assets/stocks_ohlc_data_1751553774887.parquet"
     df.write_parquet(output_path)
     
-    print(f"Sample data created with {len(data_rows)} records for {len(symbols)} symbols")
+    print(f"Sample data created with {df.height} records for {len(symbols)} symbols")
     print(f"Data saved to: {output_path}")
-    print(f"Date range: {min(dates)} to {max(dates)}")
+    print(f"Date range: {dates[0]} to {dates[-1]}")
     
     return output_path
 
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from typing import Optional
 from datetime import datetime
 from models import SubscriptionTier
@@ -13,24 +13,22 @@ class UserLogin(BaseModel):
     password: str
 
 class UserResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
     id: int
     username: str
     email: str
     is_active: bool
     created_at: datetime
-    
-    class Config:
-        from_attributes = True
 
 class SubscriptionResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
     id: int
     tier: SubscriptionTier
     is_active: bool
     expires_at: Optional[datetime]
     created_at: datetime
-    
-    class Config:
-        from_attributes = True
 
 class UserWithSubscription(UserResponse):
     subscription: Optional[SubscriptionResponse]
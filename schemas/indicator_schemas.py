@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, ValidationInfo, field_validator
 from typing import List, Optional, Dict, Any
 from datetime import date, datetime
 from enum import Enum
@@ -11,6 +11,8 @@ class IndicatorType(str, Enum):
     BOLLINGER_BANDS = "bollinger_bands"
 
 class IndicatorRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     symbol: str = Field(..., description="Stock symbol")
     start_date: date = Field(..., description="Start date for analysis")
     end_date: date = Field(..., description="End date for analysis")
@@ -30,9 +32,16 @@ class IndicatorRequest(BaseModel):
     # Bollinger Bands specific
     std_dev: Optional[float] = Field(2.0, ge=0.5, le=5.0, description="Standard deviation multiplier for Bollinger Bands")
     
-    @validator('end_date')
-    def end_date_after_start_date(cls, v, values):
-        if 'start_date' in values and v <= values['start_date']:
+    @property
+    def window_or_period(self) -> Optional[int]:
+        """Moving-average window, falling back to period"""
+        return self.window or self.period
+    
+    @field_validator('end_date')
+    @classmethod
+    def end_date_after_start_date(cls, v: date, info: ValidationInfo) -> date:
+        start_date = info.data.get('start_date')
+        if start_date is not None and v <= start_date:
             raise ValueError('end_date must be after start_date')
         return v
 
@@ -1,16 +1,45 @@
-import json
-import hashlib
+import asyncio
+import fnmatch
 import logging
-from typing import Any, Optional
+import orjson
+import xxhash
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 import redis.asyncio as redis
+from cachetools import TLRUCache
 from config import settings
 
+_SCAN_BATCH_SIZE = 500
+
+# Mutable records that must never be served from a worker's local copy after
+# they change elsewhere; only Redis, which every worker shares, holds them
+_NO_L1_PREFIXES = frozenset({"user"})
+
+def _l1_expiry(_key: str, value: Tuple[bytes, int], now: float) -> float:
+    return now + value[1]
+
+def _retrieve_exception(task: asyncio.Task):
+    # Every caller may have gone; a failure nobody awaits is not reported by asyncio
+    if not task.cancelled():
+        task.exception()
+
 class CacheService:
     """Service for caching frequently accessed data"""
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.redis_client: Optional[redis.Redis] = None
+        # Process-local copies of hot payloads as (payload, ttl) to skip the Redis round trip
+        self._l1: TLRUCache = TLRUCache(maxsize=settings.CACHE_L1_SIZE, ttu=_l1_expiry)
+        # Reads and writes queued for the next pipelined round trip
+        self._pending: List[Tuple[tuple, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: set = set()
+        # Batches reach Redis one at a time, in the order they were queued
+        self._flush_lock = asyncio.Lock()
+        # Unacknowledged fire-and-forget writes, bounded by CACHE_MAX_PENDING_WRITES
+        self._pending_writes: set = set()
+        # Cache misses currently being computed, keyed by cache key
+        self._inflight: Dict[str, asyncio.Future] = {}
         self._initialize_redis()
 
     def _initialize_redis(self):
@@ -18,10 +47,15 @@ class CacheService:
         try:
             self.redis_client = redis.from_url(
                 settings.REDIS_URL,
-                encoding="utf-8",
-                decode_responses=True,
+                # Values are orjson bytes end to end, no UTF-8 decode needed
+                decode_responses=False,
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
                 socket_connect_timeout=5,
-                socket_timeout=5
+                socket_timeout=5,
+                socket_keepalive=True,
+                health_check_interval=30,
+                client_name="stock-tech-analyzer",
+                protocol=3
             )
             self.logger.info("Redis connection initialized")
         except Exception as e:
@@ -30,22 +64,83 @@ class CacheService:
 
     def _generate_cache_key(self, prefix: str, **kwargs) -> str:
         """Generate a cache key from parameters"""
-        key_data = json.dumps(kwargs, sort_keys=True, default=str)
-        key_hash = hashlib.md5(key_data.encode()).hexdigest()
+        key_data = orjson.dumps(kwargs, default=str, option=orjson.OPT_SORT_KEYS)
+        key_hash = xxhash.xxh3_128_hexdigest(key_data)
         return f"{prefix}:{key_hash}"
 
+    def _enqueue(self, op: tuple) -> asyncio.Future:
+        """Queue a command for the next batch and return its result future"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((op, future))
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                settings.CACHE_BATCH_WINDOW_MS / 1000, self._start_flush
+            )
+        return future
+
+    def _start_flush(self):
+        """Hand the pending batch to a flush task"""
+        self._flush_handle = None
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._flush(batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, batch: List[Tuple[tuple, asyncio.Future]]):
+        """Send a batch as one pipeline: SETEX/DEL writes in queue order, then a single MGET"""
+        get_keys = list(dict.fromkeys(op[1] for op, _ in batch if op[0] == "get"))
+        pipe = self.redis_client.pipeline(transaction=False)
+        for op, _ in batch:
+            if op[0] == "set":
+                pipe.setex(op[1], op[2], op[3])
+            elif op[0] == "delete":
+                pipe.delete(op[1])
+        if get_keys:
+            pipe.mget(get_keys)
+        
+        try:
+            # Serialized so a write can never overtake one queued before it
+            async with self._flush_lock:
+                results = await pipe.execute()
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        values = dict(zip(get_keys, results[-1])) if get_keys else {}
+        for op, future in batch:
+            if not future.done():
+                future.set_result(values.get(op[1]) if op[0] == "get" else True)
+
     async def get(self, prefix: str, **kwargs) -> Optional[Any]:
         """Get data from cache"""
+        cached_data = await self.get_bytes(prefix, **kwargs)
+        if cached_data is None:
+            return None
+        return orjson.loads(cached_data)
+
+    async def get_bytes(self, prefix: str, **kwargs) -> Optional[bytes]:
+        """Get a pre-serialized JSON payload from cache"""
         if not self.redis_client:
             return None
         
         try:
             cache_key = self._generate_cache_key(prefix, **kwargs)
-            cached_data = await self.redis_client.get(cache_key)
+            use_l1 = prefix not in _NO_L1_PREFIXES
+            if use_l1:
+                local = self._l1.get(cache_key)
+                if local is not None:
+                    return local[0]
+            
+            cached_data = await self._enqueue(("get", cache_key))
             
             if cached_data:
                 self.logger.debug(f"Cache hit for key: {cache_key}")
-                return json.loads(cached_data)
+                if use_l1:
+                    self._l1[cache_key] = (cached_data, settings.CACHE_L1_TTL)
+                return cached_data
             
             self.logger.debug(f"Cache miss for key: {cache_key}")
             return None
@@ -54,23 +149,125 @@ class CacheService:
             self.logger.error(f"Error getting data from cache: {e}")
             return None
 
+    async def get_or_compute(
+        self,
+        prefix: str,
+        coro_factory: Callable[[], Awaitable[bytes]],
+        ttl: Optional[int] = None,
+        **kwargs
+    ) -> bytes:
+        """Return the cached payload, computing and caching it at most once per key concurrently"""
+        cache_key = self._generate_cache_key(prefix, **kwargs)
+        
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        
+        cached_data = await self.get_bytes(prefix, **kwargs)
+        if cached_data is not None:
+            return cached_data
+        
+        # Another caller may have started computing while we were reading the cache
+        inflight = self._inflight.get(cache_key)
+        if inflight is None:
+            # A task of its own, so a cancelled caller never cancels it for the others
+            inflight = asyncio.ensure_future(self._compute(cache_key, prefix, coro_factory, ttl, kwargs))
+            inflight.add_done_callback(_retrieve_exception)
+            self._inflight[cache_key] = inflight
+        return await asyncio.shield(inflight)
+
+    async def _compute(
+        self,
+        cache_key: str,
+        prefix: str,
+        coro_factory: Callable[[], Awaitable[bytes]],
+        ttl: Optional[int],
+        kwargs: Dict[str, Any]
+    ) -> bytes:
+        """Compute a missing payload and queue it for the cache"""
+        try:
+            payload = await coro_factory()
+        finally:
+            self._inflight.pop(cache_key, None)
+        
+        self.set_bytes_nowait(prefix, payload, ttl, **kwargs)
+        return payload
+
     async def set(self, prefix: str, data: Any, ttl: Optional[int] = None, **kwargs):
         """Set data in cache"""
         if not self.redis_client:
             return
         
+        try:
+            serialized_data = orjson.dumps(
+                data,
+                default=str,
+                option=orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY
+            )
+        except Exception as e:
+            self.logger.error(f"Error setting data in cache: {e}")
+            return
+        
+        await self.set_bytes(prefix, serialized_data, ttl, **kwargs)
+
+    async def set_bytes(self, prefix: str, payload: bytes, ttl: Optional[int] = None, **kwargs):
+        """Store an already serialized JSON payload in cache"""
+        if not self.redis_client:
+            return
+        
         try:
             cache_key = self._generate_cache_key(prefix, **kwargs)
-            serialized_data = json.dumps(data, default=str)
-            
             ttl = ttl or settings.CACHE_TTL
-            await self.redis_client.setex(cache_key, ttl, serialized_data)
+            if prefix not in _NO_L1_PREFIXES:
+                self._l1[cache_key] = (payload, min(ttl, settings.CACHE_L1_TTL))
+            await self._enqueue(("set", cache_key, ttl, payload))
             
             self.logger.debug(f"Data cached with key: {cache_key}, TTL: {ttl}")
             
         except Exception as e:
             self.logger.error(f"Error setting data in cache: {e}")
 
+    def set_nowait(self, prefix: str, data: Any, ttl: Optional[int] = None, **kwargs):
+        """Set data in cache without waiting for the Redis write"""
+        if not self.redis_client:
+            return
+        
+        try:
+            serialized_data = orjson.dumps(
+                data,
+                default=str,
+                option=orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY
+            )
+        except Exception as e:
+            self.logger.error(f"Error setting data in cache: {e}")
+            return
+        
+        self.set_bytes_nowait(prefix, serialized_data, ttl, **kwargs)
+
+    def set_bytes_nowait(self, prefix: str, payload: bytes, ttl: Optional[int] = None, **kwargs):
+        """Queue a serialized payload for the next cache batch and return immediately"""
+        if not self.redis_client:
+            return
+        
+        if len(self._pending_writes) >= settings.CACHE_MAX_PENDING_WRITES:
+            self.logger.warning("Too many pending cache writes, dropping write")
+            return
+        
+        cache_key = self._generate_cache_key(prefix, **kwargs)
+        ttl = ttl or settings.CACHE_TTL
+        if prefix not in _NO_L1_PREFIXES:
+            self._l1[cache_key] = (payload, min(ttl, settings.CACHE_L1_TTL))
+        
+        future = self._enqueue(("set", cache_key, ttl, payload))
+        self._pending_writes.add(future)
+        future.add_done_callback(self._on_write_done)
+
+    def _on_write_done(self, future: asyncio.Future):
+        """Release a pending write slot and log failures nobody is awaiting"""
+        self._pending_writes.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            self.logger.error(f"Error setting data in cache: {future.exception()}")
+
     async def delete(self, prefix: str, **kwargs):
         """Delete data from cache"""
         if not self.redis_client:
@@ -78,7 +275,9 @@ class CacheService:
         
         try:
             cache_key = self._generate_cache_key(prefix, **kwargs)
-            await self.redis_client.delete(cache_key)
+            self._l1.pop(cache_key, None)
+            # Queued behind any writes of the key still waiting for their batch
+            await self._enqueue(("delete", cache_key))
             self.logger.debug(f"Cache deleted for key: {cache_key}")
             
         except Exception as e:
@@ -90,10 +289,21 @@ class CacheService:
             return
         
         try:
-            keys = await self.redis_client.keys(pattern)
-            if keys:
-                await self.redis_client.delete(*keys)
-                self.logger.debug(f"Invalidated {len(keys)} cache entries matching pattern: {pattern}")
+            for key in [k for k in self._l1.keys() if fnmatch.fnmatchcase(k, pattern)]:
+                self._l1.pop(key, None)
+            
+            invalidated = 0
+            pipe = self.redis_client.pipeline(transaction=False)
+            # SCAN walks the keyspace incrementally instead of blocking Redis like KEYS
+            async for key in self.redis_client.scan_iter(match=pattern, count=_SCAN_BATCH_SIZE):
+                pipe.unlink(key)
+                invalidated += 1
+                if invalidated % _SCAN_BATCH_SIZE == 0:
+                    await pipe.execute()
+            await pipe.execute()
+            
+            if invalidated:
+                self.logger.debug(f"Invalidated {invalidated} cache entries matching pattern: {pattern}")
                 
         except Exception as e:
             self.logger.error(f"Error invalidating cache pattern: {e}")
@@ -1,20 +1,34 @@
 import polars as pl
+import numpy as np
+import orjson
 import logging
-from typing import List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 from datetime import date, datetime, timedelta
 import os
 
 from config import settings
 from utils.exceptions import CustomHTTPException
 
+_EPOCH = date(1970, 1, 1)
+
 class DataService:
     """Service for managing stock data"""
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.data: Optional[pl.DataFrame] = None
+        self.by_symbol: Dict[str, pl.DataFrame] = {}
+        self.dates_epoch: Dict[str, np.ndarray] = {}
         self.available_symbols: Set[str] = set()
+        self._symbols_sorted: List[str] = []
+        self._symbols_response: bytes = b""
         self.data_loaded = False
+        # Days of history each subscription tier may access
+        self._tier_access_days: Dict[str, int] = {
+            "free": settings.DATA_ACCESS_FREE,
+            "pro": settings.DATA_ACCESS_PRO,
+            "premium": settings.DATA_ACCESS_PREMIUM
+        }
+        self._earliest_cache: Optional[Tuple[date, Dict[str, date]]] = None
 
     async def load_data(self):
         """Load data from parquet file"""
@@ -22,18 +36,38 @@ class DataService:
             if not os.path.exists(settings.PARQUET_DATA_PATH):
                 # Create sample data if file doesn't exist
                 self.logger.warning(f"Parquet file not found at {settings.PARQUET_DATA_PATH}, creating sample data")
-                self._create_sample_data()
+                lazy_data = self._create_sample_data().lazy()
             else:
-                self.data = pl.read_parquet(settings.PARQUET_DATA_PATH)
+                lazy_data = pl.scan_parquet(settings.PARQUET_DATA_PATH)
             
             # Convert date column to date type if it's not already
-            if 'date' in self.data.columns:
-                self.data = self.data.with_columns([
+            if 'date' in lazy_data.collect_schema().names():
+                lazy_data = lazy_data.with_columns([
                     pl.col("date").cast(pl.Date).alias("date")
                 ])
             
+            # Cast and sort in a single pass, so each partition is already in date order.
+            # Only the per-symbol partitions are kept; the combined frame is freed here
+            data = lazy_data.sort(["symbol", "date"]).collect()
+            self.by_symbol = {
+                key[0]: group
+                for key, group in data.partition_by("symbol", as_dict=True).items()
+            }
+            del data
+            # Int32 days since epoch per symbol, for searchsorted range lookups
+            self.dates_epoch = {
+                symbol: group.get_column("date").to_physical().to_numpy()
+                for symbol, group in self.by_symbol.items()
+            }
+            
             # Get available symbols
-            self.available_symbols = set(self.data.select("symbol").unique().to_series().to_list())
+            self.available_symbols = set(self.by_symbol)
+            # The symbol list only changes on reload, so serialize it once here
+            self._symbols_sorted = sorted(self.available_symbols)
+            self._symbols_response = orjson.dumps({
+                "symbols": self._symbols_sorted,
+                "count": len(self._symbols_sorted)
+            })
             
             self.data_loaded = True
             self.logger.info(f"Data loaded successfully. {len(self.available_symbols)} symbols available")
@@ -46,56 +80,45 @@ class DataService:
                 error_code="DATA_LOAD_ERROR"
             )
 
-    def _create_sample_data(self):
+    def _create_sample_data(self) -> pl.DataFrame:
         """Create sample data for demonstration"""
-        import random
-        import numpy as np
-        from datetime import date, timedelta
-        
         # Generate sample data for demonstration
         symbols = ["AAPL", "GOOGL", "MSFT", "TSLA", "AMZN"]
-        start_date = date.today() - timedelta(days=1095)  # 3 years
-        dates = []
-        data_rows = []
+        start_date = np.datetime64(date.today() - timedelta(days=1095), "D")  # 3 years
+        dates = np.arange(start_date, start_date + 1095)
+        # Skip weekends for stock data
+        dates = dates[np.is_busday(dates)]
+        n = len(dates)
         
-        for i in range(1095):
-            current_date = start_date + timedelta(days=i)
-            # Skip weekends for stock data
-            if current_date.weekday() < 5:  # Monday = 0, Sunday = 6
-                dates.append(current_date)
+        rng = np.random.default_rng()
+        frames = []
         
         for symbol in symbols:
-            base_price = random.uniform(50, 300)
+            base_price = rng.uniform(50, 300)
+            
+            # Generate realistic OHLC data with some trend and volatility;
+            # each day opens at the previous close
+            trend = 0.0001 * np.arange(n)  # Small upward trend
+            volatility = rng.uniform(-0.05, 0.05, n)
+            close_price = np.maximum(base_price * np.cumprod(1 + trend + volatility), 1.0)  # Ensure positive price
+            open_price = np.concatenate(([base_price], close_price[:-1]))
             
-            for i, date_val in enumerate(dates):
-                # Generate realistic OHLC data with some trend and volatility
-                trend = 0.0001 * i  # Small upward trend
-                volatility = random.uniform(-0.05, 0.05)
-                
-                if i == 0:
-                    open_price = base_price
-                else:
-                    open_price = data_rows[-1]['close'] if data_rows and data_rows[-1]['symbol'] == symbol else base_price
-                
-                change = (trend + volatility) * open_price
-                close_price = max(open_price + change, 1.0)  # Ensure positive price
-                
-                high_price = max(open_price, close_price) * random.uniform(1.001, 1.05)
-                low_price = min(open_price, close_price) * random.uniform(0.95, 0.999)
-                volume = random.randint(100000, 10000000)
-                
-                data_rows.append({
-                    'date': date_val,
-                    'symbol': symbol,
-                    'open': round(open_price, 2),
-                    'high': round(high_price, 2),
-                    'low': round(low_price, 2),
-                    'close': round(close_price, 2),
-                    'volume': volume
-                })
+            high_price = np.maximum(open_price, close_price) * rng.uniform(1.001, 1.05, n)
+            low_price = np.minimum(open_price, close_price) * rng.uniform(0.95, 0.999, n)
+            volume = rng.integers(100000, 10000000, n, endpoint=True)
+            
+            frames.append(pl.DataFrame({
+                'date': dates,
+                'symbol': np.full(n, symbol),
+                'open': np.round(open_price, 2),
+                'high': np.round(high_price, 2),
+                'low': np.round(low_price, 2),
+                'close': np.round(close_price, 2),
+                'volume': volume
+            }))
         
-        self.data = pl.DataFrame(data_rows)
         self.logger.info("Sample data created successfully")
+        return pl.concat(frames)
 
     def get_available_symbols(self) -> List[str]:
         """Get list of available symbols"""
@@ -105,7 +128,17 @@ class DataService:
                 detail="Data not loaded",
                 error_code="DATA_NOT_LOADED"
             )
-        return sorted(list(self.available_symbols))
+        return self._symbols_sorted
+
+    def get_available_symbols_response(self) -> bytes:
+        """Get the pre-serialized available symbols response body"""
+        if not self.data_loaded:
+            raise CustomHTTPException(
+                status_code=500,
+                detail="Data not loaded",
+                error_code="DATA_NOT_LOADED"
+            )
+        return self._symbols_response
 
     def get_stock_data(self, symbol: str, start_date: date, end_date: date) -> pl.DataFrame:
         """Get stock data for a specific symbol and date range"""
@@ -124,13 +157,11 @@ class DataService:
             )
         
         try:
-            filtered_data = self.data.filter(
-                (pl.col("symbol") == symbol) &
-                (pl.col("date") >= start_date) &
-                (pl.col("date") <= end_date)
-            ).sort("date")
+            dates = self.dates_epoch[symbol]
+            lo = int(np.searchsorted(dates, (start_date - _EPOCH).days, side="left"))
+            hi = int(np.searchsorted(dates, (end_date - _EPOCH).days, side="right"))
             
-            return filtered_data
+            return self.by_symbol[symbol].slice(lo, hi - lo)
             
         except Exception as e:
             self.logger.error(f"Error filtering stock data: {e}")
@@ -140,25 +171,37 @@ class DataService:
                 error_code="DATA_RETRIEVAL_ERROR"
             )
 
+    def get_last_bar_date(self, symbol: str) -> date:
+        """Get the date of the most recent bar loaded for a symbol"""
+        if symbol not in self.available_symbols:
+            raise CustomHTTPException(
+                status_code=404,
+                detail=f"Symbol {symbol} not found",
+                error_code="SYMBOL_NOT_FOUND"
+            )
+        return _EPOCH + timedelta(days=int(self.dates_epoch[symbol][-1]))
+
+    def _earliest_allowed_dates(self) -> Dict[str, date]:
+        """Earliest accessible date per tier, recomputed when the day changes"""
+        today = date.today()
+        if self._earliest_cache is None or self._earliest_cache[0] != today:
+            self._earliest_cache = (today, {
+                tier: today - timedelta(days=days_back)
+                for tier, days_back in self._tier_access_days.items()
+            })
+        return self._earliest_cache[1]
+
     def validate_date_range_for_tier(self, start_date: date, end_date: date, tier: str):
         """Validate if the date range is allowed for the user's subscription tier"""
-        today = date.today()
-        
-        if tier == "free":
-            max_days_back = settings.DATA_ACCESS_FREE
-        elif tier == "pro":
-            max_days_back = settings.DATA_ACCESS_PRO
-        elif tier == "premium":
-            max_days_back = settings.DATA_ACCESS_PREMIUM
-        else:
+        try:
+            earliest_allowed_date = self._earliest_allowed_dates()[tier]
+        except KeyError:
             raise CustomHTTPException(
                 status_code=400,
                 detail="Invalid subscription tier",
                 error_code="INVALID_TIER"
             )
         
-        earliest_allowed_date = today - timedelta(days=max_days_back)
-        
         if start_date < earliest_allowed_date:
             raise CustomHTTPException(
                 status_code=403,
@@ -1,71 +1,259 @@
+import asyncio
 import logging
-from datetime import datetime, timezone, timedelta
-from typing import Dict, Tuple
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+import time
+from collections import defaultdict
+from typing import DefaultDict, Dict, Optional, Tuple
+import redis.asyncio as redis
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import func, select
 from fastapi import HTTPException, status
 
-from models import User, Subscription, RateLimit, SubscriptionTier
+from auth import AuthenticatedUser
+from database import dialect_insert
+from models import RateLimit, SubscriptionTier
 from config import settings
 from utils.exceptions import CustomHTTPException
 
+_DAY_SECONDS = 86400
+
+# Daily request limit per tier; every SubscriptionTier has an entry
+_TIER_LIMITS: Dict[SubscriptionTier, int] = {
+    SubscriptionTier.FREE: settings.RATE_LIMIT_FREE,
+    SubscriptionTier.PRO: settings.RATE_LIMIT_PRO,
+    SubscriptionTier.PREMIUM: settings.RATE_LIMIT_PREMIUM
+}
+
+# (user_id, endpoint, window_start) identifying one rate_limits row
+CounterKey = Tuple[int, str, int]
+
+# Atomic check of the fixed UTC-day window the database path also enforces,
+# in a single round trip; only allowed requests are counted.
+# KEYS[1]: per user/day usage hash
+# ARGV: endpoint, daily_limit, usage_ttl_seconds
+# Returns {allowed, requests_made}
+_DAILY_WINDOW_SCRIPT = """
+local used = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or 0)
+if used >= tonumber(ARGV[2]) then
+    return {0, used}
+end
+used = redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {1, used}
+"""
+
+class CounterFlusher:
+    """In-process rate limit counters written to the database in periodic batches
+    
+    Counts are the last total read back from the database plus whatever this
+    worker has not flushed yet, so other workers' requests show up within one
+    flush interval.
+    """
+    
+    def __init__(self, session_factory: async_sessionmaker):
+        self.logger = logging.getLogger(__name__)
+        self._session_factory = session_factory
+        self._pending: DefaultDict[CounterKey, int] = defaultdict(int)
+        self._flushing: Dict[CounterKey, int] = {}
+        self._flushed: Dict[CounterKey, int] = {}
+        # Consecutive failed flushes
+        self._failures = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start flushing every RATE_LIMIT_FLUSH_INTERVAL_MS"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the flush loop and write out the remaining counts"""
+        if self._task is not None:
+            # Never cancel in the middle of a flush
+            async with self._lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        await self.flush()
+
+    async def increment(self, db: AsyncSession, key: CounterKey) -> int:
+        """Count one request and return the window's total including it"""
+        if key not in self._flushed:
+            user_id, endpoint, window_start = key
+            result = await db.execute(
+                select(RateLimit.requests_count).where(
+                    RateLimit.user_id == user_id,
+                    RateLimit.endpoint == endpoint,
+                    RateLimit.window_start == window_start
+                )
+            )
+            self._flushed.setdefault(key, result.scalar_one_or_none() or 0)
+        
+        self._pending[key] += 1
+        return self._flushed[key] + self._unflushed(key)
+
+    def record(self, key: CounterKey):
+        """Count one request enforced elsewhere, without reading its total"""
+        self._pending[key] += 1
+
+    def unflushed_for_user(self, user_id: int, window_start: int) -> Dict[str, int]:
+        """Per-endpoint counts for a user's window not yet in the database"""
+        counts: DefaultDict[str, int] = defaultdict(int)
+        for counter in (self._flushing, self._pending):
+            for (uid, endpoint, start), count in counter.items():
+                if uid == user_id and start == window_start:
+                    counts[endpoint] += count
+        return counts
+
+    async def flush(self):
+        """Add the pending counts to their rows in one upsert"""
+        async with self._lock:
+            if not self._pending:
+                return
+            
+            self._flushing, self._pending = self._pending, defaultdict(int)
+            try:
+                async with self._session_factory() as session:
+                    result = await session.execute(
+                        _upsert_counters(self._flushing).returning(
+                            RateLimit.user_id,
+                            RateLimit.endpoint,
+                            RateLimit.window_start,
+                            RateLimit.requests_count
+                        )
+                    )
+                    rows = result.all()
+                    await session.commit()
+            except Exception as e:
+                self._failures += 1
+                if self._failures <= settings.RATE_LIMIT_FLUSH_MAX_RETRIES:
+                    if self._failures == 1:
+                        self.logger.warning("Error flushing rate limit counters, retrying: %s", e)
+                    for key, count in self._flushing.items():
+                        self._pending[key] += count
+                elif self._failures == settings.RATE_LIMIT_FLUSH_MAX_RETRIES + 1:
+                    # A persistent failure must not grow the pending counts without bound
+                    self.logger.error(
+                        "Rate limit counters failed to flush %s times, dropping counts until "
+                        "the database recovers: %s",
+                        self._failures, e
+                    )
+            else:
+                if self._failures > settings.RATE_LIMIT_FLUSH_MAX_RETRIES:
+                    self.logger.info("Rate limit counters flushing again")
+                self._failures = 0
+                
+                # Totals now include other workers' flushed requests
+                for row in rows:
+                    self._flushed[(row.user_id, row.endpoint, row.window_start)] = row.requests_count
+                
+                window_start = _current_window_start()
+                for key in [key for key in self._flushed if key[2] < window_start]:
+                    del self._flushed[key]
+            finally:
+                self._flushing = {}
+
+    async def _flush_loop(self):
+        interval = settings.RATE_LIMIT_FLUSH_INTERVAL_MS / 1000
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def _unflushed(self, key: CounterKey) -> int:
+        return self._flushing.get(key, 0) + self._pending.get(key, 0)
+
 class RateLimiterService:
     """Service for handling rate limiting based on subscription tiers"""
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.tier_limits = {
-            SubscriptionTier.FREE: settings.RATE_LIMIT_FREE,
-            SubscriptionTier.PRO: settings.RATE_LIMIT_PRO,
-            SubscriptionTier.PREMIUM: settings.RATE_LIMIT_PREMIUM
-        }
+        self.redis_client: Optional[redis.Redis] = None
+        self._window_script = None
+        self.counters: Optional[CounterFlusher] = None
+
+    async def initialize(self, redis_client: Optional[redis.Redis], session_factory: async_sessionmaker):
+        """Set up the database counters and load the daily window script into Redis; without it the database is used"""
+        self.counters = CounterFlusher(session_factory)
+        
+        if redis_client is None:
+            return
+        
+        try:
+            await redis_client.script_load(_DAILY_WINDOW_SCRIPT)
+        except Exception as e:
+            self.logger.warning("Redis rate limiting unavailable, using database: %s", e)
+            return
+        
+        self.redis_client = redis_client
+        # Runs via EVALSHA and reloads the script if Redis lost it
+        self._window_script = redis_client.register_script(_DAILY_WINDOW_SCRIPT)
+        self.logger.info("Redis rate limiting initialized")
 
     async def check_rate_limit(self, 
-                              user: User, 
-                              subscription: Subscription, 
+                              user: AuthenticatedUser, 
                               endpoint: str,
                               db: AsyncSession) -> Tuple[bool, Dict[str, int]]:
         """
         Check if user has exceeded rate limit for the endpoint
         Returns: (is_allowed, rate_limit_info)
         """
-        try:
-            current_time = datetime.now(timezone.utc)
-            window_start = current_time.replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            # Get or create rate limit record for today
-            result = await db.execute(
-                select(RateLimit).where(
-                    RateLimit.user_id == user.id,
-                    RateLimit.endpoint == endpoint,
-                    RateLimit.window_start >= window_start
-                )
+        if self._window_script is not None:
+            try:
+                return await self._check_rate_limit_redis(user, endpoint)
+            except Exception as e:
+                self.logger.error("Error checking rate limit in Redis, using database: %s", e)
+        
+        return await self._check_rate_limit_db(user, endpoint, db)
+
+    async def _check_rate_limit_redis(self,
+                                      user: AuthenticatedUser,
+                                      endpoint: str) -> Tuple[bool, Dict[str, int]]:
+        """Count the request against the user's daily window in one EVALSHA"""
+        window_start = _current_window_start()
+        daily_limit = _TIER_LIMITS[user.tier]
+        
+        allowed, current_count = await self._window_script(
+            keys=[_usage_key(user.id, window_start)],
+            args=[endpoint, daily_limit, 2 * _DAY_SECONDS]
+        )
+        
+        is_allowed = bool(allowed)
+        if is_allowed:
+            # Usage history still lands in rate_limits, and the database path
+            # picks up today's count if Redis goes away
+            self.counters.record((user.id, endpoint, window_start))
+        
+        rate_limit_info = {
+            "requests_made": current_count,
+            "daily_limit": daily_limit,
+            "remaining": max(0, daily_limit - current_count),
+            "reset_time": window_start + _DAY_SECONDS
+        }
+        
+        if not is_allowed:
+            self.logger.warning(
+                "Rate limit exceeded for user %s on endpoint %s. Count: %s, Limit: %s",
+                user.id, endpoint, current_count, daily_limit
             )
-            rate_limit_record = result.scalar_one_or_none()
-            
-            # Get the limit for user's subscription tier
-            daily_limit = self.tier_limits.get(subscription.tier, settings.RATE_LIMIT_FREE)
-            
-            if rate_limit_record is None:
-                # Create new rate limit record
-                rate_limit_record = RateLimit(
-                    user_id=user.id,
-                    endpoint=endpoint,
-                    requests_count=1,
-                    window_start=window_start
-                )
-                db.add(rate_limit_record)
-                current_count = 1
-            else:
-                # Update existing record
-                current_count = rate_limit_record.requests_count + 1
-                await db.execute(
-                    update(RateLimit)
-                    .where(RateLimit.id == rate_limit_record.id)
-                    .values(requests_count=current_count)
-                )
-            
-            await db.commit()
+        
+        return is_allowed, rate_limit_info
+
+    async def _check_rate_limit_db(self,
+                                   user: AuthenticatedUser,
+                                   endpoint: str,
+                                   db: AsyncSession) -> Tuple[bool, Dict[str, int]]:
+        """Fixed daily window counted in the rate_limits table"""
+        window_start = _current_window_start()
+        
+        # Get the limit for user's subscription tier
+        daily_limit = _TIER_LIMITS[user.tier]
+        
+        try:
+            # Counted in memory; the background flusher writes it out in a batch
+            current_count = await self.counters.increment(db, (user.id, endpoint, window_start))
             
             # Check if limit exceeded
             is_allowed = current_count <= daily_limit
@@ -74,105 +262,89 @@ class RateLimiterService:
                 "requests_made": current_count,
                 "daily_limit": daily_limit,
                 "remaining": max(0, daily_limit - current_count),
-                "reset_time": int((window_start + timedelta(days=1)).timestamp())
+                "reset_time": window_start + _DAY_SECONDS
             }
             
             if not is_allowed:
                 self.logger.warning(
-                    f"Rate limit exceeded for user {user.id} on endpoint {endpoint}. "
-                    f"Count: {current_count}, Limit: {daily_limit}"
+                    "Rate limit exceeded for user %s on endpoint %s. Count: %s, Limit: %s",
+                    user.id, endpoint, current_count, daily_limit
                 )
             
             return is_allowed, rate_limit_info
             
         except Exception as e:
-            self.logger.error(f"Error checking rate limit: {e}")
+            self.logger.error("Error checking rate limit: %s", e)
             # In case of error, allow the request but log it
             return True, {
                 "requests_made": 0,
                 "daily_limit": daily_limit,
                 "remaining": daily_limit,
-                "reset_time": int((window_start + timedelta(days=1)).timestamp())
+                "reset_time": window_start + _DAY_SECONDS
             }
 
     async def increment_rate_limit(self, 
-                                  user: User, 
+                                  user: AuthenticatedUser, 
                                   endpoint: str,
                                   db: AsyncSession):
         """Increment rate limit counter for user and endpoint"""
         try:
-            current_time = datetime.now(timezone.utc)
-            window_start = current_time.replace(hour=0, minute=0, second=0, microsecond=0)
+            window_start = _current_window_start()
             
-            # Get existing rate limit record
-            result = await db.execute(
-                select(RateLimit).where(
-                    RateLimit.user_id == user.id,
-                    RateLimit.endpoint == endpoint,
-                    RateLimit.window_start >= window_start
-                )
-            )
-            rate_limit_record = result.scalar_one_or_none()
-            
-            if rate_limit_record:
-                await db.execute(
-                    update(RateLimit)
-                    .where(RateLimit.id == rate_limit_record.id)
-                    .values(requests_count=RateLimit.requests_count + 1)
-                )
-            else:
-                # Create new record
-                new_record = RateLimit(
-                    user_id=user.id,
-                    endpoint=endpoint,
-                    requests_count=1,
-                    window_start=window_start
-                )
-                db.add(new_record)
-            
-            await db.commit()
+            await self.counters.increment(db, (user.id, endpoint, window_start))
             
         except Exception as e:
-            self.logger.error(f"Error incrementing rate limit: {e}")
+            self.logger.error("Error incrementing rate limit: %s", e)
 
     async def get_user_rate_limit_status(self, 
-                                       user: User, 
-                                       subscription: Subscription,
+                                       user: AuthenticatedUser, 
                                        db: AsyncSession) -> Dict[str, any]:
         """Get current rate limit status for user"""
         try:
-            current_time = datetime.now(timezone.utc)
-            window_start = current_time.replace(hour=0, minute=0, second=0, microsecond=0)
+            window_start = _current_window_start()
+            
+            if self.redis_client is not None:
+                try:
+                    return await self._get_status_redis(user, window_start)
+                except Exception as e:
+                    self.logger.error("Error reading rate limit usage from Redis, using database: %s", e)
             
-            # Get all rate limit records for today
+            # Today's per-endpoint counts with the day's total alongside, as plain rows
             result = await db.execute(
-                select(RateLimit).where(
+                select(
+                    RateLimit.endpoint,
+                    RateLimit.requests_count,
+                    func.sum(RateLimit.requests_count).over().label("total_requests")
+                ).where(
                     RateLimit.user_id == user.id,
                     RateLimit.window_start >= window_start
                 )
             )
-            rate_limit_records = result.scalars().all()
+            rows = result.all()
             
-            daily_limit = self.tier_limits.get(subscription.tier, settings.RATE_LIMIT_FREE)
+            daily_limit = _TIER_LIMITS[user.tier]
             
-            total_requests = sum(record.requests_count for record in rate_limit_records)
+            endpoints = {row.endpoint: row.requests_count for row in rows}
+            total_requests = rows[0].total_requests if rows else 0
+            
+            # Include requests still waiting for the next counter flush
+            for endpoint, count in self.counters.unflushed_for_user(user.id, window_start).items():
+                endpoints[endpoint] = endpoints.get(endpoint, 0) + count
+                total_requests += count
             
             return {
-                "subscription_tier": subscription.tier.value,
+                "subscription_tier": user.tier.value,
                 "daily_limit": daily_limit,
                 "total_requests_today": total_requests,
                 "remaining_requests": max(0, daily_limit - total_requests),
-                "reset_time": int((window_start + timedelta(days=1)).timestamp()),
-                "endpoints": {
-                    record.endpoint: record.requests_count 
-                    for record in rate_limit_records
-                }
+                "reset_time": window_start + _DAY_SECONDS,
+                "endpoints": endpoints
             }
             
         except Exception as e:
-            self.logger.error(f"Error getting rate limit status: {e}")
+            self.logger.error("Error getting rate limit status: %s", e)
             return {
-                "subscription_tier": subscription.tier.value,
+                "subscription_tier": user.tier.value,
                 "daily_limit": 0,
                 "total_requests_today": 0,
                 "remaining_requests": 0,
@@ -180,17 +352,42 @@ class RateLimiterService:
                 "endpoints": {}
             }
 
-    async def cleanup_old_rate_limits(self, db: AsyncSession, days_old: int = 7):
-        """Clean up old rate limit records"""
-        try:
-            cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_old)
-            
-            await db.execute(
-                delete(RateLimit).where(RateLimit.window_start < cutoff_date)
-            )
-            await db.commit()
-            
-            self.logger.info(f"Cleaned up rate limit records older than {days_old} days")
-            
-        except Exception as e:
-            self.logger.error(f"Error cleaning up old rate limits: {e}")
+    async def _get_status_redis(self,
+                                user: AuthenticatedUser,
+                                window_start: int) -> Dict[str, any]:
+        """Build the status from today's per-endpoint usage hash"""
+        usage = await self.redis_client.hgetall(_usage_key(user.id, window_start))
+        endpoints = {endpoint.decode(): int(count) for endpoint, count in usage.items()}
+        
+        daily_limit = _TIER_LIMITS[user.tier]
+        total_requests = sum(endpoints.values())
+        
+        return {
+            "subscription_tier": user.tier.value,
+            "daily_limit": daily_limit,
+            "total_requests_today": total_requests,
+            "remaining_requests": max(0, daily_limit - total_requests),
+            "reset_time": window_start + _DAY_SECONDS,
+            "endpoints": endpoints
+        }
+
+def _current_window_start() -> int:
+    """Start of the current UTC day in epoch seconds"""
+    return int(time.time()) // _DAY_SECONDS * _DAY_SECONDS
+
+def _upsert_counters(counts: Dict[CounterKey, int]):
+    """INSERT window counters, or add the counts to the rows that already exist"""
+    stmt = dialect_insert(RateLimit).values([
+        {"user_id": user_id, "endpoint": endpoint, "window_start": window_start, "requests_count": count}
+        for (user_id, endpoint, window_start), count in counts.items()
+    ])
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "endpoint", "window_start"],
+        set_={"requests_count": RateLimit.requests_count + stmt.excluded.requests_count}
+    )
+
+def _usage_key(user_id: int, window_start: int) -> str:
+    day = window_start // _DAY_SECONDS
+    return f"ratelimit:{{{user_id}}}:usage:{day}"
+
+rate_limiter = RateLimiterService()
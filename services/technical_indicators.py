@@ -1,13 +1,22 @@
+import functools
 import numpy as np
 import polars as pl
-from typing import List, Dict, Any, Optional
+from typing import Dict, Any, Optional
 from datetime import date
 import logging
 
-from schemas.indicator_schemas import (
-    IndicatorType, IndicatorDataPoint, MACDDataPoint, 
-    BollingerBandsDataPoint, IndicatorResponse
-)
+from config import settings
+from schemas.indicator_schemas import IndicatorType
+
+# Response row columns per indicator, mirroring IndicatorDataPoint,
+# MACDDataPoint and BollingerBandsDataPoint after the date
+_OUTPUT_COLUMNS = {
+    IndicatorType.SMA: [pl.col("sma").alias("value"), pl.lit(None).alias("additional_data")],
+    IndicatorType.EMA: [pl.col("ema").alias("value"), pl.lit(None).alias("additional_data")],
+    IndicatorType.RSI: [pl.col("rsi").alias("value"), pl.lit(None).alias("additional_data")],
+    IndicatorType.MACD: ["macd", "signal", "histogram"],
+    IndicatorType.BOLLINGER_BANDS: ["upper_band", "middle_band", "lower_band"]
+}
 
 class TechnicalIndicatorService:
     """Service for calculating technical indicators"""
@@ -17,54 +26,39 @@ class TechnicalIndicatorService:
 
     def calculate_sma(self, df: pl.DataFrame, period: int) -> pl.DataFrame:
         """Calculate Simple Moving Average"""
-        try:
-            return df.with_columns([
-                pl.col("close").rolling_mean(window_size=period).alias("sma")
-            ])
-        except Exception as e:
-            self.logger.error(f"Error calculating SMA: {e}")
-            raise
+        return df.with_columns([
+            pl.col("close").rolling_mean(window_size=period).alias("sma")
+        ])
 
     def calculate_ema(self, df: pl.DataFrame, period: int) -> pl.DataFrame:
         """Calculate Exponential Moving Average"""
-        try:
-            alpha = 2.0 / (period + 1.0)
-            return df.with_columns([
-                pl.col("close").ewm_mean(alpha=alpha).alias("ema")
-            ])
-        except Exception as e:
-            self.logger.error(f"Error calculating EMA: {e}")
-            raise
+        alpha = 2.0 / (period + 1.0)
+        return df.with_columns([
+            pl.col("close").ewm_mean(alpha=alpha).alias("ema")
+        ])
 
     def calculate_rsi(self, df: pl.DataFrame, period: int = 14) -> pl.DataFrame:
         """Calculate Relative Strength Index"""
-        try:
-            # Calculate price changes
-            df_with_changes = df.with_columns([
-                (pl.col("close") - pl.col("close").shift(1)).alias("price_change")
-            ])
-            
-            # Separate gains and losses
-            df_with_gains_losses = df_with_changes.with_columns([
-                pl.when(pl.col("price_change") > 0)
-                .then(pl.col("price_change"))
-                .otherwise(0.0)
-                .alias("gain"),
-                
-                pl.when(pl.col("price_change") < 0)
-                .then(-pl.col("price_change"))
-                .otherwise(0.0)
-                .alias("loss")
+        if df.height >= settings.INDICATOR_NUMBA_MIN_ROWS and df.get_column("close").null_count() == 0:
+            # Long series: one compiled pass instead of several intermediate columns
+            avg_gain, avg_loss, rsi = _rolling_rsi_kernel()(df.get_column("close").to_numpy(), period)
+            return df.with_columns([
+                pl.Series("avg_gain", avg_gain, nan_to_null=True),
+                pl.Series("avg_loss", avg_loss, nan_to_null=True),
+                pl.Series("rsi", rsi, nan_to_null=True)
             ])
-            
-            # Calculate average gains and losses
-            df_with_averages = df_with_gains_losses.with_columns([
-                pl.col("gain").rolling_mean(window_size=period).alias("avg_gain"),
-                pl.col("loss").rolling_mean(window_size=period).alias("avg_loss")
+        
+        # Split price changes into gains and losses and average them in one pass;
+        # the first change has no predecessor and counts as zero
+        price_change = pl.col("close").diff().fill_null(0.0)
+        return (
+            df.lazy()
+            .with_columns([
+                price_change.clip(lower_bound=0.0).rolling_mean(window_size=period).alias("avg_gain"),
+                (-price_change).clip(lower_bound=0.0).rolling_mean(window_size=period).alias("avg_loss")
             ])
-            
             # Calculate RSI
-            df_with_rsi = df_with_averages.with_columns([
+            .with_columns([
                 pl.when(pl.col("avg_loss") == 0)
                 .then(100.0)
                 .otherwise(
@@ -72,141 +66,153 @@ class TechnicalIndicatorService:
                 )
                 .alias("rsi")
             ])
-            
-            return df_with_rsi
-            
-        except Exception as e:
-            self.logger.error(f"Error calculating RSI: {e}")
-            raise
+            .collect()
+        )
 
     def calculate_macd(self, df: pl.DataFrame, fast_period: int = 12, 
                       slow_period: int = 26, signal_period: int = 9) -> pl.DataFrame:
         """Calculate MACD (Moving Average Convergence Divergence)"""
-        try:
-            # Calculate fast and slow EMAs
-            fast_alpha = 2.0 / (fast_period + 1.0)
-            slow_alpha = 2.0 / (slow_period + 1.0)
-            signal_alpha = 2.0 / (signal_period + 1.0)
-            
-            df_with_emas = df.with_columns([
+        # Calculate fast and slow EMAs
+        fast_alpha = 2.0 / (fast_period + 1.0)
+        slow_alpha = 2.0 / (slow_period + 1.0)
+        signal_alpha = 2.0 / (signal_period + 1.0)
+        
+        # One lazy plan: EMAs, MACD line, signal line and histogram in a single collect
+        return (
+            df.lazy()
+            .with_columns([
                 pl.col("close").ewm_mean(alpha=fast_alpha).alias("ema_fast"),
                 pl.col("close").ewm_mean(alpha=slow_alpha).alias("ema_slow")
             ])
-            
-            # Calculate MACD line
-            df_with_macd = df_with_emas.with_columns([
+            .with_columns([
                 (pl.col("ema_fast") - pl.col("ema_slow")).alias("macd")
             ])
-            
-            # Calculate signal line
-            df_with_signal = df_with_macd.with_columns([
+            .with_columns([
                 pl.col("macd").ewm_mean(alpha=signal_alpha).alias("signal")
             ])
-            
-            # Calculate histogram
-            df_final = df_with_signal.with_columns([
+            .with_columns([
                 (pl.col("macd") - pl.col("signal")).alias("histogram")
             ])
-            
-            return df_final
-            
-        except Exception as e:
-            self.logger.error(f"Error calculating MACD: {e}")
-            raise
+            .collect()
+        )
 
     def calculate_bollinger_bands(self, df: pl.DataFrame, period: int = 20, 
                                  std_dev: float = 2.0) -> pl.DataFrame:
         """Calculate Bollinger Bands"""
-        try:
-            df_with_sma = df.with_columns([
-                pl.col("close").rolling_mean(window_size=period).alias("middle_band")
-            ])
-            
-            df_with_std = df_with_sma.with_columns([
+        # rolling_std is kept over sqrt(mean(x^2) - mean(x)^2): Polars does not fuse
+        # the two rolling means, and the difference cancels badly at price scale,
+        # leaving flat windows with a non-zero band width
+        return (
+            df.lazy()
+            .with_columns([
+                pl.col("close").rolling_mean(window_size=period).alias("middle_band"),
                 pl.col("close").rolling_std(window_size=period).alias("std_dev")
             ])
-            
-            df_with_bands = df_with_std.with_columns([
+            .with_columns([
                 (pl.col("middle_band") + (pl.col("std_dev") * std_dev)).alias("upper_band"),
                 (pl.col("middle_band") - (pl.col("std_dev") * std_dev)).alias("lower_band")
             ])
-            
-            return df_with_bands
-            
-        except Exception as e:
-            self.logger.error(f"Error calculating Bollinger Bands: {e}")
-            raise
+            .collect()
+        )
 
     def process_indicator_request(self, df: pl.DataFrame, 
                                 indicator_type: IndicatorType,
-                                parameters: Dict[str, Any]) -> List[Any]:
-        """Process indicator request and return formatted data"""
+                                parameters: Dict[str, Any]) -> pl.DataFrame:
+        """Process indicator request and return the response rows as a frame
+        
+        Columns match the fields of the indicator's *DataPoint schema.
+        """
         try:
-            if indicator_type == IndicatorType.SMA:
-                period = parameters.get('period', parameters.get('window', 14))
-                result_df = self.calculate_sma(df, period)
-                return [
-                    IndicatorDataPoint(
-                        date=row['date'],
-                        value=row['sma'] if row['sma'] is not None else None
-                    )
-                    for row in result_df.to_dicts()
-                ]
-                
-            elif indicator_type == IndicatorType.EMA:
-                period = parameters.get('period', parameters.get('window', 14))
-                result_df = self.calculate_ema(df, period)
-                return [
-                    IndicatorDataPoint(
-                        date=row['date'],
-                        value=row['ema'] if row['ema'] is not None else None
-                    )
-                    for row in result_df.to_dicts()
-                ]
-                
-            elif indicator_type == IndicatorType.RSI:
-                period = parameters.get('period', 14)
-                result_df = self.calculate_rsi(df, period)
-                return [
-                    IndicatorDataPoint(
-                        date=row['date'],
-                        value=row['rsi'] if row['rsi'] is not None else None
-                    )
-                    for row in result_df.to_dicts()
-                ]
-                
-            elif indicator_type == IndicatorType.MACD:
-                fast_period = parameters.get('fast_period', 12)
-                slow_period = parameters.get('slow_period', 26)
-                signal_period = parameters.get('signal_period', 9)
-                result_df = self.calculate_macd(df, fast_period, slow_period, signal_period)
-                return [
-                    MACDDataPoint(
-                        date=row['date'],
-                        macd=row['macd'] if row['macd'] is not None else None,
-                        signal=row['signal'] if row['signal'] is not None else None,
-                        histogram=row['histogram'] if row['histogram'] is not None else None
-                    )
-                    for row in result_df.to_dicts()
-                ]
-                
-            elif indicator_type == IndicatorType.BOLLINGER_BANDS:
-                period = parameters.get('period', 20)
-                std_dev = parameters.get('std_dev', 2.0)
-                result_df = self.calculate_bollinger_bands(df, period, std_dev)
-                return [
-                    BollingerBandsDataPoint(
-                        date=row['date'],
-                        upper_band=row['upper_band'] if row['upper_band'] is not None else None,
-                        middle_band=row['middle_band'] if row['middle_band'] is not None else None,
-                        lower_band=row['lower_band'] if row['lower_band'] is not None else None
-                    )
-                    for row in result_df.to_dicts()
-                ]
-                
-            else:
-                raise ValueError(f"Unsupported indicator type: {indicator_type}")
+            df = _downcast_close(df)
+            
+            result_df = self._calculate(df, indicator_type, parameters)
+            return result_df.select(["date", *_OUTPUT_COLUMNS[indicator_type]])
                 
         except Exception as e:
-            self.logger.error(f"Error processing indicator request: {e}")
+            self.logger.error("Error processing %s indicator request: %s", indicator_type.value, e)
             raise
+
+    def _calculate(self, df: pl.DataFrame, indicator_type: IndicatorType,
+                   parameters: Dict[str, Any]) -> pl.DataFrame:
+        """Dispatch to the calculate_* method for the indicator type"""
+        if indicator_type == IndicatorType.SMA:
+            return self.calculate_sma(df, parameters.get('period', parameters.get('window', 14)))
+        
+        elif indicator_type == IndicatorType.EMA:
+            return self.calculate_ema(df, parameters.get('period', parameters.get('window', 14)))
+        
+        elif indicator_type == IndicatorType.RSI:
+            return self.calculate_rsi(df, parameters.get('period', 14))
+        
+        elif indicator_type == IndicatorType.MACD:
+            return self.calculate_macd(
+                df,
+                parameters.get('fast_period', 12),
+                parameters.get('slow_period', 26),
+                parameters.get('signal_period', 9)
+            )
+        
+        elif indicator_type == IndicatorType.BOLLINGER_BANDS:
+            return self.calculate_bollinger_bands(
+                df, parameters.get('period', 20), parameters.get('std_dev', 2.0)
+            )
+        
+        raise ValueError(f"Unsupported indicator type: {indicator_type}")
+
+@functools.lru_cache(maxsize=None)
+def _rolling_rsi_kernel():
+    """Compile _rolling_rsi with numba on first use
+    
+    Importing numba loads LLVM, so it waits until a series is long enough to need the kernel.
+    """
+    from numba import njit
+    return njit(cache=True)(_rolling_rsi)
+
+def _rolling_rsi(close: np.ndarray, period: int):
+    """RSI from simple rolling means of gains and losses, matching calculate_rsi
+    
+    Returns (avg_gain, avg_loss, rsi) with NaN where the window is incomplete.
+    """
+    n = close.shape[0]
+    changes = np.zeros(n)
+    for i in range(1, n):
+        changes[i] = close[i] - close[i - 1]
+    
+    avg_gain = np.full(n, np.nan)
+    avg_loss = np.full(n, np.nan)
+    rsi = np.full(n, np.nan)
+    gain_sum = 0.0
+    loss_sum = 0.0
+    # Losing bars in the window, so a flat or rising window is exactly zero loss
+    losses = 0
+    for i in range(n):
+        change = changes[i]
+        if change > 0:
+            gain_sum += change
+        elif change < 0:
+            loss_sum -= change
+            losses += 1
+        
+        if i >= period:
+            dropped = changes[i - period]
+            if dropped > 0:
+                gain_sum -= dropped
+            elif dropped < 0:
+                loss_sum += dropped
+                losses -= 1
+        
+        if i >= period - 1:
+            avg_gain[i] = gain_sum / period
+            avg_loss[i] = loss_sum / period if losses > 0 else 0.0
+            if losses == 0:
+                rsi[i] = 100.0
+            else:
+                rsi[i] = 100.0 - (100.0 / (1.0 + (avg_gain[i] / avg_loss[i])))
+    
+    return avg_gain, avg_loss, rsi
+
+def _downcast_close(df: pl.DataFrame) -> pl.DataFrame:
+    """Use float32 close prices for long (intraday sized) series to halve memory traffic"""
+    if df.height < settings.INDICATOR_FLOAT32_MIN_ROWS:
+        return df
+    return df.with_columns(pl.col("close").cast(pl.Float32))
@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# Settings are read when config is first imported, so these must be set before
+# any test module imports the app. The app's lifespan creates tables and flushes
+# rate limit counters on DATABASE_URL; a scratch database keeps the suite away
+# from the working tree's stock_analysis.db. Without a parquet file the data
+# service generates sample data ending today, inside every tier's history.
+_scratch = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_scratch.name, 'test.db')}"
+os.environ["PARQUET_DATA_PATH"] = os.path.join(_scratch.name, "missing.parquet")
@@ -0,0 +1,182 @@
+import base64
+import hashlib
+import hmac
+import time
+
+import jwt
+import orjson
+import pytest
+
+from auth import _DECODE_OPTIONS, _fast_verify_hs256, _get_token_user_id, _pyjwt, auth_service
+from utils.exceptions import CustomHTTPException
+
+KEY = auth_service._secret_bytes
+HEADER = {"alg": "HS256", "typ": "JWT"}
+
+def _b64(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+def _token(header, payload, key=KEY, digest=hashlib.sha256) -> str:
+    """Sign arbitrary header and payload JSON, bypassing PyJWT's own checks"""
+    signing_input = _b64(orjson.dumps(header)) + b"." + _b64(orjson.dumps(payload))
+    signature = hmac.new(key, signing_input, digest).digest()
+    return (signing_input + b"." + _b64(signature)).decode()
+
+def _claims(**overrides):
+    now = int(time.time())
+    claims = {"user_id": 1, "username": "testuser", "exp": now + 60, "iat": now}
+    claims.update(overrides)
+    return {name: value for name, value in claims.items() if value is not ...}
+
+def _pyjwt_outcome(token):
+    try:
+        _pyjwt.decode(token, KEY, algorithms=("HS256",), options=_DECODE_OPTIONS)
+    except jwt.InvalidTokenError as e:
+        return type(e)
+    return None
+
+def _outcome(token):
+    """What decode_token does: the fast path, falling back to PyJWT"""
+    try:
+        if _fast_verify_hs256(token, KEY) is None:
+            return _pyjwt_outcome(token)
+    except jwt.InvalidTokenError as e:
+        return type(e)
+    return None
+
+def _error_code(token):
+    with pytest.raises(CustomHTTPException) as exc_info:
+        auth_service.decode_token(token)
+    assert exc_info.value.status_code == 401
+    return exc_info.value.error_code
+
+def test_valid_token_takes_fast_path():
+    token = auth_service.create_access_token(user_id=7, username="testuser")
+    payload = _fast_verify_hs256(token, KEY)
+    assert payload["user_id"] == 7
+    assert auth_service.decode_token(token) == payload
+
+def test_tampered_signature_is_rejected():
+    token = auth_service.create_access_token(user_id=7, username="testuser")
+    head, _, signature = token.rpartition(".")
+    tampered = head + "." + ("A" if signature[0] != "A" else "B") + signature[1:]
+
+    with pytest.raises(jwt.InvalidSignatureError):
+        _fast_verify_hs256(tampered, KEY)
+    assert _error_code(tampered) == "INVALID_TOKEN"
+
+def test_tampered_payload_is_rejected():
+    token = auth_service.create_access_token(user_id=7, username="testuser")
+    header, _, signature = token.split(".")
+    forged = header + "." + _b64(orjson.dumps(_claims(user_id=1))).decode() + "." + signature
+
+    with pytest.raises(jwt.InvalidSignatureError):
+        _fast_verify_hs256(forged, KEY)
+    assert _error_code(forged) == "INVALID_TOKEN"
+
+def test_wrong_key_is_rejected():
+    token = _token(HEADER, _claims(), key=b"some-other-secret")
+    with pytest.raises(jwt.InvalidSignatureError):
+        _fast_verify_hs256(token, KEY)
+
+@pytest.mark.parametrize("header", [{"alg": "none"}, {"alg": "HS512", "typ": "JWT"}, {"alg": "hs256"}])
+def test_other_algorithms_fall_back_and_are_rejected(header):
+    token = _token(header, _claims(), digest=hashlib.sha512)
+
+    # Only PyJWT decides on anything but HS256, and it only allows HS256
+    assert _fast_verify_hs256(token, KEY) is None
+    assert _outcome(token) is jwt.InvalidAlgorithmError
+    assert _error_code(token) == "INVALID_TOKEN"
+
+def test_unsigned_token_is_rejected_before_decoding():
+    token = _b64(orjson.dumps({"alg": "none"})).decode() + "." + _b64(orjson.dumps(_claims())).decode() + "."
+    assert _error_code(token) == "INVALID_TOKEN"
+
+def test_expired_token():
+    token = _token(HEADER, _claims(exp=int(time.time()) - 1))
+    with pytest.raises(jwt.ExpiredSignatureError):
+        _fast_verify_hs256(token, KEY)
+    assert _error_code(token) == "TOKEN_EXPIRED"
+
+def test_future_iat_is_rejected():
+    token = _token(HEADER, _claims(iat=int(time.time()) + 3600))
+    with pytest.raises(jwt.ImmatureSignatureError):
+        _fast_verify_hs256(token, KEY)
+    assert _error_code(token) == "INVALID_TOKEN"
+
+@pytest.mark.parametrize("claim", ["exp", "iat", "user_id"])
+@pytest.mark.parametrize("value", [..., None])
+def test_missing_or_null_required_claim(claim, value):
+    token = _token(HEADER, _claims(**{claim: value}))
+    with pytest.raises(jwt.MissingRequiredClaimError):
+        _fast_verify_hs256(token, KEY)
+    assert _outcome(token) is _pyjwt_outcome(token) is jwt.MissingRequiredClaimError
+
+@pytest.mark.parametrize("claims, error", [
+    (_claims(exp=[1]), jwt.DecodeError),
+    (_claims(exp={"at": 1}), jwt.DecodeError),
+    (_claims(iat=[1]), jwt.InvalidIssuedAtError),
+])
+def test_non_numeric_times_are_rejected(claims, error):
+    token = _token(HEADER, claims)
+    with pytest.raises(error):
+        _fast_verify_hs256(token, KEY)
+    assert _error_code(token) == "INVALID_TOKEN"
+
+def test_fallback_claim_errors_are_invalid_tokens():
+    # PyJWT raises a bare TypeError for these rather than an InvalidTokenError
+    for claims in (_claims(nbf=[1]), _claims(nbf=1, exp=[1])):
+        assert _error_code(_token(HEADER, claims)) == "INVALID_TOKEN"
+
+@pytest.mark.parametrize("claims", [
+    _claims(exp="soon"),
+    _claims(exp=str(int(time.time()) + 60)),
+    _claims(exp=time.time() + 60.5),
+    _claims(iat="yesterday"),
+    _claims(iat=int(time.time()) - 0.5),
+])
+def test_non_integer_times_match_pyjwt(claims):
+    token = _token(HEADER, claims)
+    # Values PyJWT would coerce with int() are left to it
+    assert _fast_verify_hs256(token, KEY) is None
+    assert _outcome(token) is _pyjwt_outcome(token)
+
+@pytest.mark.parametrize("header, claims", [
+    ({"alg": "HS256", "kid": "key-1"}, _claims()),
+    ({"alg": "HS256", "crit": ["exp"]}, _claims()),
+    (HEADER, _claims(nbf=int(time.time()) + 3600)),
+    (HEADER, _claims(nbf=int(time.time()) - 3600)),
+    (HEADER, _claims(aud="someone-else")),
+])
+def test_unhandled_headers_and_claims_fall_back_to_pyjwt(header, claims):
+    token = _token(header, claims)
+    assert _fast_verify_hs256(token, KEY) is None
+    assert _outcome(token) is _pyjwt_outcome(token)
+
+def test_future_nbf_and_audience_are_rejected_by_fallback():
+    for claims in (_claims(nbf=int(time.time()) + 3600), _claims(aud="someone-else")):
+        assert _error_code(_token(HEADER, claims)) == "INVALID_TOKEN"
+
+@pytest.mark.parametrize("payload", [[1, 2], "user", 42, None, True])
+def test_non_object_payload_is_rejected(payload):
+    token = _token(HEADER, payload)
+    with pytest.raises(jwt.DecodeError):
+        _fast_verify_hs256(token, KEY)
+    assert _outcome(token) is _pyjwt_outcome(token) is jwt.DecodeError
+
+def test_malformed_segments_are_rejected():
+    token = _token(HEADER, _claims())
+    header, payload, signature = token.split(".")
+    for broken in (
+        "e30." + payload + "." + signature,          # header has no alg
+        header + "." + payload + "." + signature + "A",  # signature length is invalid base64
+        "bm90IGpzb24." + payload + "." + signature,  # header is not JSON
+    ):
+        assert _outcome(broken) is not None
+        assert _error_code(broken) == "INVALID_TOKEN"
+
+def test_null_user_id_never_authenticates():
+    token = _token(HEADER, _claims(user_id=None))
+    assert _error_code(token) == "INVALID_TOKEN"
+    with pytest.raises(CustomHTTPException):
+        _get_token_user_id(token)
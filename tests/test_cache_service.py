@@ -0,0 +1,90 @@
+import asyncio
+
+import fakeredis
+import pytest
+import pytest_asyncio
+
+from services.cache_service import CacheService
+
+@pytest_asyncio.fixture
+async def shared_redis():
+    """One Redis server, as every worker would see it"""
+    server = fakeredis.FakeServer()
+    yield lambda: fakeredis.FakeAsyncRedis(server=server)
+
+def _worker(shared_redis) -> CacheService:
+    cache = CacheService()
+    cache.redis_client = shared_redis()
+    return cache
+
+@pytest.mark.asyncio
+async def test_user_entries_are_not_served_from_l1(shared_redis):
+    worker_a, worker_b = _worker(shared_redis), _worker(shared_redis)
+    await worker_a.set("user", {"tier": "free"}, user_id=1)
+    assert await worker_a.get("user", user_id=1) == {"tier": "free"}
+
+    # An upgrade handled by another worker is seen on the next read
+    await worker_b.delete("user", user_id=1)
+    await worker_b.set("user", {"tier": "pro"}, user_id=1)
+    assert await worker_a.get("user", user_id=1) == {"tier": "pro"}
+    assert len(worker_a._l1) == 0
+
+@pytest.mark.asyncio
+async def test_other_entries_use_l1(shared_redis):
+    cache = _worker(shared_redis)
+    await cache.set("symbols", ["AAA"])
+    assert len(cache._l1) == 1
+    assert await cache.get("symbols") == ["AAA"]
+
+@pytest.mark.asyncio
+async def test_delete_lands_after_queued_write(shared_redis):
+    cache = _worker(shared_redis)
+    # A fire-and-forget write still waiting for its batch when the key is deleted
+    cache.set_nowait("user", {"tier": "free"}, user_id=1)
+    await cache.delete("user", user_id=1)
+
+    assert await cache.redis_client.exists(cache._generate_cache_key("user", user_id=1)) == 0
+    assert await cache.get("user", user_id=1) is None
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_computation(shared_redis):
+    cache = _worker(shared_redis)
+    started, release = asyncio.Event(), asyncio.Event()
+    calls = 0
+
+    async def build() -> bytes:
+        nonlocal calls
+        calls += 1
+        started.set()
+        await release.wait()
+        return b'{"rows": 1}'
+
+    owner = asyncio.create_task(cache.get_or_compute("indicator", build, symbol="AAA"))
+    await started.wait()
+    waiter = asyncio.create_task(cache.get_or_compute("indicator", build, symbol="AAA"))
+    await asyncio.sleep(0)
+
+    # The request that started the computation goes away, e.g. its client disconnected
+    owner.cancel()
+    release.set()
+
+    assert await waiter == b'{"rows": 1}'
+    assert owner.cancelled()
+    assert calls == 1
+    assert await cache.get_bytes("indicator", symbol="AAA") == b'{"rows": 1}'
+
+@pytest.mark.asyncio
+async def test_failed_computation_reaches_every_caller(shared_redis):
+    cache = _worker(shared_redis)
+
+    async def build() -> bytes:
+        await asyncio.sleep(0.01)
+        raise ValueError("no data")
+
+    results = await asyncio.gather(
+        cache.get_or_compute("indicator", build, symbol="AAA"),
+        cache.get_or_compute("indicator", build, symbol="AAA"),
+        return_exceptions=True
+    )
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert not cache._inflight
@@ -1,36 +1,41 @@
 import pytest
+import pytest_asyncio
+from datetime import timedelta
 from fastapi.testclient import TestClient
 from main import app
 from models import User, Subscription, SubscriptionTier
 from database import get_db
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.pool import StaticPool
 import os
 
-# Test database setup
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Test database setup, on the same async driver the app uses
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
-engine = create_engine(
+engine = create_async_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
     poolclass=StaticPool,
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
+async def override_get_db():
+    # Same commit/rollback handling as database.get_db
+    async with TestingSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
 
 # Fixtures
-@pytest.fixture(scope="module")
-def test_client():
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def test_client():
     # Create test database tables
     from database import Base
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
     
     # Override the database dependency
     app.dependency_overrides[get_db] = override_get_db
@@ -39,67 +44,78 @@ def test_client():
         yield client
     
     # Clean up
-    Base.metadata.drop_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
 
-@pytest.fixture(scope="module")
-def test_user():
-    db = next(override_get_db())
-    
-    # Create test user
-    user = User(
-        username="testuser",
-        email="test@example.com",
-        hashed_password="$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW"  # password: test123
-    )
-    db.add(user)
-    db.commit()
-    
-    # Create subscription
-    subscription = Subscription(
-        user_id=user.id,
-        tier=SubscriptionTier.PREMIUM
-    )
-    db.add(subscription)
-    db.commit()
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def test_user(test_client):
+    async with TestingSessionLocal() as db:
+        # Create test user
+        user = User(
+            username="testuser",
+            email="test@example.com",
+            hashed_password="$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW"  # password: secret
+        )
+        db.add(user)
+        await db.commit()
+        
+        # Create subscription
+        subscription = Subscription(
+            user_id=user.id,
+            tier=SubscriptionTier.PREMIUM
+        )
+        db.add(subscription)
+        await db.commit()
     
     return user
 
-def test_get_sma(test_client, test_user):
-    # Get auth token
+def _auth_headers(test_client):
     response = test_client.post(
-        "/api/auth/token",
-        data={"username": "testuser", "password": "test123"}
+        "/api/auth/login",
+        json={"username": "testuser", "password": "secret"}
     )
     assert response.status_code == 200
-    token = response.json()["access_token"]
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def _calculate(test_client, headers, **request):
+    # The latest six months of any loaded symbol
+    symbol = test_client.get("/api/indicators/symbols", headers=headers).json()["symbols"][0]
+    end_date = test_client.app.state.data_service.get_last_bar_date(symbol)
+    start_date = end_date - timedelta(days=182)
+    return test_client.post(
+        "/api/indicators/calculate",
+        json={
+            "symbol": symbol,
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            **request
+        },
+        headers=headers
+    )
+
+def test_get_sma(test_client, test_user):
+    headers = _auth_headers(test_client)
     
     # Test SMA endpoint
-    response = test_client.get(
-        "/api/indicators/sma?symbol=AAPL&period=20",
-        headers={"Authorization": f"Bearer {token}"}
-    )
+    response = _calculate(test_client, headers, indicator="sma", period=20)
     assert response.status_code == 200
     data = response.json()
-    assert "sma" in data
-    assert len(data["sma"]) > 0
+    assert data["indicator"] == "sma"
+    assert data["parameters"] == {"period": 20}
+    assert len(data["data"]) > 20
+    # No value until the first full window
+    assert all(point["value"] is None for point in data["data"][:19])
+    assert all(point["value"] > 0 for point in data["data"][19:])
 
 def test_get_rsi(test_client, test_user):
-    # Get auth token
-    response = test_client.post(
-        "/api/auth/token",
-        data={"username": "testuser", "password": "test123"}
-    )
-    assert response.status_code == 200
-    token = response.json()["access_token"]
+    headers = _auth_headers(test_client)
     
     # Test RSI endpoint
-    response = test_client.get(
-        "/api/indicators/rsi?symbol=AAPL&period=14",
-        headers={"Authorization": f"Bearer {token}"}
-    )
+    response = _calculate(test_client, headers, indicator="rsi", period=14)
     assert response.status_code == 200
     data = response.json()
-    assert "rsi" in data
-    assert len(data["rsi"]) > 0
+    assert data["indicator"] == "rsi"
+    assert len(data["data"]) > 14
+    assert all(0 <= point["value"] <= 100 for point in data["data"][13:])
 
 # Add more test cases for other indicators and edge cases
@@ -0,0 +1,189 @@
+from unittest.mock import Mock
+
+import fakeredis
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import StaticPool
+
+import services.rate_limiter as rate_limiter_module
+from auth import AuthenticatedUser
+from config import settings
+from database import Base
+from models import RateLimit, SubscriptionTier
+from services.rate_limiter import CounterFlusher, RateLimiterService, _current_window_start
+
+def _session_factory():
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    return engine, async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+@pytest_asyncio.fixture
+async def sessions():
+    """Sessions on a fresh in-memory database with the schema"""
+    engine, factory = _session_factory()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield factory
+    await engine.dispose()
+
+@pytest_asyncio.fixture
+async def broken_sessions():
+    """Sessions on a database without the rate_limits table"""
+    engine, factory = _session_factory()
+    yield factory
+    await engine.dispose()
+
+async def _stored_counts(factory):
+    async with factory() as db:
+        result = await db.execute(select(RateLimit.endpoint, RateLimit.requests_count))
+        return dict(result.all())
+
+async def _count_requests(flusher, factory, endpoint, times):
+    key = (1, endpoint, _current_window_start())
+    async with factory() as db:
+        return [await flusher.increment(db, key) for _ in range(times)]
+
+@pytest.mark.asyncio
+async def test_flush_writes_pending_counts(sessions):
+    flusher = CounterFlusher(sessions)
+
+    assert await _count_requests(flusher, sessions, "symbols", 3) == [1, 2, 3]
+    await _count_requests(flusher, sessions, "stock_data", 1)
+    await flusher.flush()
+
+    assert await _stored_counts(sessions) == {"symbols": 3, "stock_data": 1}
+    # Later requests build on the flushed total
+    assert await _count_requests(flusher, sessions, "symbols", 1) == [4]
+    await flusher.flush()
+    assert await _stored_counts(sessions) == {"symbols": 4, "stock_data": 1}
+
+@pytest.mark.asyncio
+async def test_failed_flush_requeues_counts(sessions, broken_sessions):
+    flusher = CounterFlusher(sessions)
+    await _count_requests(flusher, sessions, "symbols", 2)
+
+    # Point the flush at a database without the table, then restore it
+    flusher._session_factory = broken_sessions
+    await flusher.flush()
+    flusher._session_factory = sessions
+
+    # Nothing lost: the counts still apply and reach the database on retry
+    assert await _count_requests(flusher, sessions, "symbols", 1) == [3]
+    await flusher.flush()
+    assert await _stored_counts(sessions) == {"symbols": 3}
+
+@pytest.mark.asyncio
+async def test_persistent_flush_failure_drops_counts(broken_sessions, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_FLUSH_MAX_RETRIES", 2)
+    flusher = CounterFlusher(broken_sessions)
+    flusher.logger = Mock()
+    key = (1, "symbols", _current_window_start())
+    # Skip the snapshot read, which would fail on the same database
+    flusher._flushed[key] = 0
+
+    for _ in range(5):
+        flusher._pending[key] += 1
+        await flusher.flush()
+
+    # Re-queued twice, then dropped and reported once
+    assert not flusher._pending
+    assert flusher.logger.warning.call_count == 1
+    assert flusher.logger.error.call_count == 1
+
+@pytest.mark.asyncio
+async def test_stop_drains_pending_counts(sessions, monkeypatch):
+    # Far longer than the test, so only the shutdown flush can write
+    monkeypatch.setattr(settings, "RATE_LIMIT_FLUSH_INTERVAL_MS", 60_000)
+    flusher = CounterFlusher(sessions)
+    flusher.start()
+
+    await _count_requests(flusher, sessions, "symbols", 2)
+    await flusher.stop()
+
+    assert await _stored_counts(sessions) == {"symbols": 2}
+    assert flusher._task is None
+
+class _Clock:
+    """Stands in for the time module so a test can move through days"""
+    
+    def __init__(self):
+        self.now = 1_751_328_000.0
+    
+    def time(self) -> float:
+        return self.now
+
+@pytest_asyncio.fixture
+async def redis_limiter(monkeypatch, sessions):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter_module, "time", clock)
+    limiter = RateLimiterService()
+    await limiter.initialize(fakeredis.FakeAsyncRedis(), sessions)
+    yield limiter, clock
+    await limiter.redis_client.aclose()
+
+def _user(tier=SubscriptionTier.FREE) -> AuthenticatedUser:
+    return AuthenticatedUser(id=1, username="testuser", tier=tier)
+
+async def _allowed(limiter, user, times, db=None):
+    return [(await limiter.check_rate_limit(user, "symbols", db))[0] for _ in range(times)].count(True)
+
+@pytest.mark.asyncio
+async def test_redis_window_counts_only_allowed_requests(redis_limiter):
+    limiter, _ = redis_limiter
+    assert await _allowed(limiter, _user(), 55) == settings.RATE_LIMIT_FREE
+    
+    is_allowed, info = await limiter.check_rate_limit(_user(), "symbols", None)
+    assert not is_allowed
+    assert (info["requests_made"], info["remaining"]) == (50, 0)
+    
+    status = await limiter.get_user_rate_limit_status(_user(), None)
+    assert status["total_requests_today"] == 50
+    assert status["endpoints"] == {"symbols": 50}
+    assert status["remaining_requests"] == 0
+
+@pytest.mark.asyncio
+async def test_redis_and_database_enforce_the_same_limit(redis_limiter, sessions):
+    limiter, _ = redis_limiter
+    db_limiter = RateLimiterService()
+    await db_limiter.initialize(None, sessions)
+    
+    async with sessions() as db:
+        assert await _allowed(db_limiter, _user(), 55, db) == settings.RATE_LIMIT_FREE
+    assert await _allowed(limiter, _user(), 55) == settings.RATE_LIMIT_FREE
+
+@pytest.mark.asyncio
+async def test_redis_window_resets_each_day(redis_limiter):
+    limiter, clock = redis_limiter
+    await _allowed(limiter, _user(), 50)
+    
+    clock.now += 86400
+    is_allowed, info = await limiter.check_rate_limit(_user(), "symbols", None)
+    assert is_allowed
+    assert info["requests_made"] == 1
+
+@pytest.mark.asyncio
+async def test_redis_window_keeps_usage_across_tier_change(redis_limiter):
+    limiter, _ = redis_limiter
+    await _allowed(limiter, _user(), 51)
+    
+    is_allowed, info = await limiter.check_rate_limit(_user(SubscriptionTier.PRO), "symbols", None)
+    assert is_allowed
+    assert (info["requests_made"], info["remaining"]) == (51, 449)
+
+@pytest.mark.asyncio
+async def test_redis_usage_is_flushed_to_the_database(redis_limiter, sessions):
+    limiter, _ = redis_limiter
+    await _allowed(limiter, _user(), 55)
+    await limiter.counters.flush()
+    
+    assert await _stored_counts(sessions) == {"symbols": 50}
+    
+    # The database fallback continues from the same total
+    limiter._window_script = None
+    async with sessions() as db:
+        assert await _allowed(limiter, _user(), 1, db) == 0
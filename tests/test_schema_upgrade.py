@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from database import Base, _upgrade_schema
+import models  # noqa: F401  registers the tables on Base.metadata
+
+# rate_limits as created before window_start became epoch seconds
+OLD_RATE_LIMITS = """
+CREATE TABLE rate_limits (
+    id INTEGER NOT NULL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    endpoint VARCHAR(100) NOT NULL,
+    requests_count INTEGER NOT NULL,
+    window_start DATETIME NOT NULL,
+    created_at DATETIME NOT NULL
+)
+"""
+
+@pytest.mark.asyncio
+async def test_upgrade_converts_old_rate_limits():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.execute(text(OLD_RATE_LIMITS))
+        for window_start, count in [
+            ("2025-07-01 00:00:00.000000", 3),
+            ("2025-07-01 00:00:00.000000", 4),
+            ("2025-07-02 00:00:00.000000", 5),
+        ]:
+            await conn.execute(
+                text(
+                    "INSERT INTO rate_limits (user_id, endpoint, requests_count, window_start, created_at) "
+                    "VALUES (1, 'symbols', :count, :window_start, '2025-07-01')"
+                ),
+                {"count": count, "window_start": window_start}
+            )
+        await conn.run_sync(Base.metadata.create_all)
+
+        await conn.run_sync(_upgrade_schema)
+        # A second run finds nothing left to do
+        await conn.run_sync(_upgrade_schema)
+
+        rows = (await conn.execute(text(
+            "SELECT requests_count, window_start, typeof(window_start) FROM rate_limits ORDER BY id"
+        ))).all()
+        indexes = await conn.run_sync(
+            lambda sync_conn: {index["name"] for index in inspect(sync_conn).get_indexes("rate_limits")}
+        )
+    await engine.dispose()
+
+    # Duplicate windows are folded together and stored as UTC day starts
+    assert rows == [(7, 1751328000, "integer"), (5, 1751414400, "integer")]
+    assert "uq_rate_limits_user_endpoint_window" in indexes
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+import pytest
+
+from config import settings
+from schemas.indicator_schemas import IndicatorType
+from services.technical_indicators import TechnicalIndicatorService
+
+technical_service = TechnicalIndicatorService()
+
+def _random_walk(rows: int, seed: int = 1) -> pl.DataFrame:
+    """Intraday-like close prices with a flat stretch, which has no losses"""
+    rng = np.random.default_rng(seed)
+    close = np.round(np.cumprod(1 + rng.normal(0, 0.001, rows)) * 100, 2)
+    close[1000:1030] = close[999]
+    return pl.DataFrame({"close": close})
+
+@pytest.mark.parametrize("period", [2, 14, 29])
+def test_numba_rsi_matches_polars(monkeypatch, period):
+    df = _random_walk(5000)
+
+    monkeypatch.setattr(settings, "INDICATOR_NUMBA_MIN_ROWS", 0)
+    compiled = technical_service.calculate_rsi(df, period)
+    monkeypatch.setattr(settings, "INDICATOR_NUMBA_MIN_ROWS", 10**9)
+    expected = technical_service.calculate_rsi(df, period)
+
+    assert compiled.columns == expected.columns
+    for column in ("avg_gain", "avg_loss", "rsi"):
+        assert compiled[column].is_null().to_list() == expected[column].is_null().to_list()
+        np.testing.assert_allclose(
+            compiled[column].to_numpy(), expected[column].to_numpy(), rtol=0, atol=1e-6, equal_nan=True
+        )
+    # The flat stretch is exactly zero loss on both paths
+    assert compiled["rsi"][1029] == expected["rsi"][1029] == 100.0
+
+def test_series_with_nulls_skip_numba(monkeypatch):
+    monkeypatch.setattr(settings, "INDICATOR_NUMBA_MIN_ROWS", 0)
+    df = _random_walk(2000).with_columns(
+        pl.when(pl.int_range(pl.len()) == 100).then(None).otherwise(pl.col("close")).alias("close")
+    )
+
+    result = technical_service.calculate_rsi(df, 14)
+    monkeypatch.setattr(settings, "INDICATOR_NUMBA_MIN_ROWS", 10**9)
+    assert result.equals(technical_service.calculate_rsi(df, 14))
+
+@pytest.mark.parametrize("indicator, parameters, tolerance", [
+    (IndicatorType.SMA, {"period": 20}, 1e-4),
+    (IndicatorType.EMA, {"period": 20}, 1e-4),
+    (IndicatorType.MACD, {}, 1e-4),
+    (IndicatorType.BOLLINGER_BANDS, {"period": 20, "std_dev": 2.0}, 1e-4),
+    # Gain/loss ratios amplify rounding; still far below what RSI is read at
+    (IndicatorType.RSI, {"period": 14}, 1e-2),
+])
+def test_float32_close_stays_within_tolerance(monkeypatch, indicator, parameters, tolerance):
+    # About two years of minute bars over 6.5 hour sessions
+    start = datetime(2024, 1, 1)
+    df = _random_walk(200_000).with_columns(
+        pl.datetime_range(start, start + timedelta(minutes=199_999), "1m", eager=True).alias("date")
+    )
+
+    monkeypatch.setattr(settings, "INDICATOR_FLOAT32_MIN_ROWS", 0)
+    downcast = technical_service.process_indicator_request(df, indicator, parameters)
+    monkeypatch.setattr(settings, "INDICATOR_FLOAT32_MIN_ROWS", 10**9)
+    expected = technical_service.process_indicator_request(df, indicator, parameters)
+
+    assert downcast.columns == expected.columns
+    assert downcast["date"].equals(expected["date"])
+    for column in expected.columns[1:]:
+        if expected[column].dtype == pl.Null:
+            continue
+        np.testing.assert_allclose(
+            downcast[column].cast(pl.Float64).to_numpy(), expected[column].to_numpy(),
+            rtol=0, atol=tolerance, equal_nan=True
+        )
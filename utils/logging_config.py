@@ -5,6 +5,11 @@ from config import settings
 def setup_logging():
     """Setup logging configuration"""
     
+    # Records never show thread or process details, so skip collecting them
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    
     # Create formatter
     formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -14,11 +19,14 @@ def setup_logging():
     # Create console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
+    console_handler.set_name("console")
     
     # Get root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, settings.LOG_LEVEL.upper()))
-    root_logger.addHandler(console_handler)
+    # Called again on reload; keep a single console handler
+    if not any(handler.get_name() == "console" for handler in root_logger.handlers):
+        root_logger.addHandler(console_handler)
     
     # Set specific logger levels
     logging.getLogger('uvicorn').setLevel(logging.INFO)
@@ -0,0 +1,15 @@
+import orjson
+import polars as pl
+from typing import Any, Dict
+
+def json_with_rows(envelope: Dict[str, Any], df: pl.DataFrame, key: str = "data") -> bytes:
+    """Serialize an envelope with the frame's rows spliced in under ``key``
+
+    The rows are written by Polars in a single native pass and inserted into
+    the orjson-encoded envelope as raw bytes, so no per-row Python objects are
+    created.
+    """
+    head = orjson.dumps(envelope)
+    rows = df.write_json().encode()
+    separator = b"," if len(envelope) else b""
+    return b"".join((head[:-1], separator, orjson.dumps(key), b":", rows, b"}"))